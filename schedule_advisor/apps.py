@@ -0,0 +1,16 @@
+from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate, post_save
+
+
+class ScheduleAdvisorConfig(AppConfig):
+    name = "schedule_advisor"
+
+    def ready(self):
+        from schedule_advisor.instrumentation import install_query_recorder
+        from schedule_advisor.models import User, create_schedule
+        from schedule_advisor.search import ensure_search_index
+
+        post_migrate.connect(ensure_search_index, sender=self)
+        connection_created.connect(install_query_recorder)
+        post_save.connect(create_schedule, sender=User)
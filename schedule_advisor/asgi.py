@@ -11,6 +11,11 @@ import os
 
 from django.core.asgi import get_asgi_application
 
+from schedule_advisor.staticfiles import ASGIWhiteNoiseHandler
+
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "schedule_advisor.settings")
+# database connections are per thread, and sync code runs on a new thread per request
+os.environ.setdefault("CONN_MAX_AGE", "0")
 
-application = get_asgi_application()
+# static files are served before Django's middleware chain, which stays async
+application = ASGIWhiteNoiseHandler(get_asgi_application())
@@ -0,0 +1,244 @@
+import copy
+import os
+import random
+import statistics
+import tempfile
+import time
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from schedule_advisor.forms import ClassSearchForm
+from schedule_advisor.ingest import write_dump
+from schedule_advisor.models import Class, Schedule, User, classes_overlap
+from schedule_advisor.search import paginate
+from schedule_advisor.test_data import DANCE_EXAMPLE
+
+# Catalog sizes (number of sections) benchmarked by default
+SIZES = [1000, 10000, 50000]
+
+# Term the synthetic catalogs are written to
+BENCHMARK_TERM = "1228"
+
+# Classes in the benchmark student's schedule and in each advisee's
+SCHEDULE_SIZE = 6
+
+# Students in the benchmark advisor's dashboard
+ADVISEES = 25
+
+# Classes compared pairwise by the classes_overlap benchmark
+OVERLAP_SAMPLE = 300
+
+MEETING_DAYS = ["MoWeFr", "TuTh", "MoWe", "Mo", "We", "Fr", "Th"]
+INSTRUCTORS = [
+    "Kathryn Schetlick",
+    "Ana Ramos",
+    "Wei Chen",
+    "Priya Natarajan",
+    "Samuel Okafor",
+    "Laura Becker",
+]
+
+
+def sis_time(minutes) -> str:
+    # e.g. 960 -> "16.00.00.000000-05:00", the format SIS sends
+    return f"{minutes // 60:02d}.{minutes % 60:02d}.00.000000-05:00"
+
+
+def synthetic_catalog(size, term=BENCHMARK_TERM, seed=0) -> list:
+    """``size`` SIS-shaped sections modelled on DANCE_EXAMPLE, spread over every
+    subject with three sections per course. The same arguments always give the
+    same catalog, so timings are comparable across commits."""
+    rng = random.Random(seed)
+    subjects = [subject for subject, _ in ClassSearchForm.SUBJECT_CHOICES]
+    catalog = []
+    for i in range(size):
+        section = copy.deepcopy(DANCE_EXAMPLE[i % len(DANCE_EXAMPLE)])
+        course = i // len(subjects)
+        start = rng.randrange(8 * 60, 19 * 60, 30)
+        end = start + rng.choice([50, 75, 165])
+        capacity = rng.choice([20, 30, 60, 150])
+        enrolled = rng.randint(0, capacity)
+        instructor = rng.choice(INSTRUCTORS)
+        section.update(
+            index=i + 1,
+            strm=term,
+            class_nbr=10000 + i,
+            subject=subjects[i % len(subjects)],
+            catalog_nbr=str(1000 + course // 3),
+            class_section=f"{course % 3 + 1:03d}",
+            class_capacity=capacity,
+            enrollment_total=enrolled,
+            enrollment_available=capacity - enrolled,
+            enrl_stat="O" if enrolled < capacity else "C",
+            instructors=[{"name": instructor, "email": ""}],
+        )
+        for meeting in section["meetings"]:
+            meeting.update(
+                days=rng.choice(MEETING_DAYS),
+                start_time=sis_time(start),
+                end_time=sis_time(end),
+                instructor=instructor,
+            )
+        catalog.append(section)
+    return catalog
+
+
+def timed(function, repeat, setup=None) -> dict:
+    """Runs ``function`` ``repeat`` times (after ``setup``, which is not timed)
+    and summarizes the wall times and the queries of the last run."""
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - started)
+    return {
+        "min_ms": round(min(times) * 1000, 2),
+        "median_ms": round(statistics.median(times) * 1000, 2),
+        "max_ms": round(max(times) * 1000, 2),
+        "queries": len(queries),
+    }
+
+
+def ok(response):
+    # a redirect or error page would be much faster than the page being measured
+    if response.status_code != 200:
+        raise RuntimeError(f"{response.request['PATH_INFO']}: {response.status_code}")
+
+
+class Benchmark:
+    """Times the catalog's hot paths against a synthetic catalog of ``size``
+    sections. Meant for an empty scratch database (see the benchmark command):
+    it deletes every class and user before starting."""
+
+    def __init__(self, size, repeat=5, term=BENCHMARK_TERM):
+        self.size = size
+        self.repeat = repeat
+        self.term = term
+        self.catalog = synthetic_catalog(size, term)
+        self.subject = self.catalog[0]["subject"]
+
+    def run(self) -> dict:
+        Class.objects.all().delete()
+        User.objects.all().delete()
+        results = {}
+        with tempfile.TemporaryDirectory() as directory:
+            dump = os.path.join(directory, f"{self.term}.jsonl")
+            write_dump(dump, self.catalog)
+            results["ingest"] = timed(
+                lambda: self.ingest(dump), 1, setup=Class.objects.all().delete
+            )
+            results["reingest_unchanged"] = timed(
+                lambda: self.ingest(dump), self.repeat
+            )
+        self.create_users()
+        for name, function in [
+            ("search_subject", self.search_subject),
+            ("search_keyword", self.search_keyword),
+            ("search_term_first_page", self.search_term_first_page),
+            ("classes_overlap", self.overlap_sample()),
+            ("class_can_be_added", self.can_be_added),
+            ("schedule_view", self.schedule_view),
+            ("advisor_view", self.advisor_view),
+            ("advisor_view_schedule", self.advisor_view_schedule),
+            ("schedule_review_view", self.schedule_review_view),
+        ]:
+            # views are measured with cold caches, i.e. the work a cache miss does
+            results[name] = timed(function, self.repeat, setup=cache.clear)
+        return results
+
+    def ingest(self, dump):
+        call_command(
+            "get_data_from_sis", terms=[self.term], from_file=dump, stdout=StringIO()
+        )
+
+    def create_users(self):
+        open_classes = list(
+            Class.objects.filter(semester=self.term, enrl_stat="O").order_by("id")
+        )
+        self.student = User.objects.create(username="benchmark-student")
+        self.advisor = User.objects.create(
+            username="benchmark-advisor", is_advisor=True
+        )
+        advisees = User.objects.bulk_create(
+            User(username=f"benchmark-advisee-{i}", advisor=self.advisor)
+            for i in range(ADVISEES)
+        )
+        # bulk_create skips the post_save signal that creates schedules
+        Schedule.objects.bulk_create(Schedule(connected_user=user) for user in advisees)
+        Schedule.objects.update(visible=True)
+        for user in [self.student] + advisees:
+            schedule = Schedule.objects.get(connected_user=user)
+            # non-conflicting classes, the way a student would have added them
+            rng = random.Random(user.username)
+            for cl in rng.sample(open_classes, min(50, len(open_classes))):
+                if len(schedule.conflict_index().class_ids) == SCHEDULE_SIZE:
+                    break
+                if schedule.class_can_be_added(cl):
+                    schedule.add_class(cl)
+        self.advisee = advisees[0]
+        self.student_client = Client()
+        self.student_client.force_login(self.student)
+        self.advisor_client = Client()
+        self.advisor_client.force_login(self.advisor)
+
+    def search_subject(self):
+        cleaned_data = {"semester": self.term, "subject": self.subject}
+        list(ClassSearchForm.get_results_from_database(cleaned_data))
+
+    def search_keyword(self):
+        cleaned_data = {"semester": self.term, "keyword": "dance"}
+        list(ClassSearchForm.get_results_from_database(cleaned_data))
+
+    def search_term_first_page(self):
+        paginate(ClassSearchForm.get_results_from_database({"semester": self.term}))
+
+    def overlap_sample(self):
+        sample = list(Class.objects.for_cards().order_by("id")[:OVERLAP_SAMPLE])
+
+        def overlap():
+            for i, class1 in enumerate(sample):
+                for class2 in sample[i + 1 :]:
+                    classes_overlap(class1, class2)
+
+        return overlap
+
+    def can_be_added(self):
+        # a fresh Schedule builds its conflict index, as it does once per request
+        schedule = Schedule.objects.get(connected_user=self.student)
+        classes = Class.objects.for_cards().filter(
+            semester=self.term, subject=self.subject
+        )
+        for cl in classes:
+            schedule.class_can_be_added(cl)
+
+    def schedule_view(self):
+        ok(self.student_client.get("/schedule/"))
+
+    def advisor_view(self):
+        ok(self.advisor_client.get("/schedules"))
+
+    def advisor_view_schedule(self):
+        ok(self.advisor_client.post("/schedules", {"advisee_id": self.advisee.id}))
+
+    def schedule_review_view(self):
+        ok(self.advisor_client.get("/schedules/review"))
+
+
+def compare(baseline, current) -> list:
+    """(size, benchmark, baseline median, current median) for every benchmark
+    in both result files, as written by the benchmark command."""
+    rows = []
+    for size, results in current["results"].items():
+        for name, timing in results.items():
+            before = baseline["results"].get(size, {}).get(name)
+            if before:
+                rows.append((size, name, before["median_ms"], timing["median_ms"]))
+    return rows
@@ -0,0 +1,178 @@
+import hashlib
+import json
+import time
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from schedule_advisor.forms import ClassSearchForm
+from schedule_advisor.models import CatalogVersion, Class
+from schedule_advisor.search import apaginate, paginate
+
+# Catalog data only changes when SIS is ingested, so every cached catalog entry
+# is keyed on its term's version and an ingest just bumps that version: stale
+# entries are never read again and age out through the backend's TTL/culling.
+#
+# Both the version and the entries keyed on it are read from the primary, even
+# while the request's other reads go to a replica: a replica that hasn't caught
+# up with an ingest would otherwise fill the new version's entries with the old
+# rows, and they would stay wrong (and keep their ETag) once it had.
+
+# Seconds a process trusts its cached copy of a term's version. The version
+# itself lives in the database, so with per-process caches an ingest run from
+# another process is picked up within this long.
+TERM_VERSION_TIMEOUT = 60
+
+
+def term_version_key(semester) -> str:
+    return f"term-version:{semester}"
+
+
+def term_version(semester) -> int:
+    key = term_version_key(semester)
+    version = cache.get(key)
+    if version is None:
+        version = (
+            CatalogVersion.objects.using(DEFAULT_DB_ALIAS)
+            .filter(semester=semester)
+            .values_list("version", flat=True)
+            .first()
+        ) or 0
+        cache.set(key, version, TERM_VERSION_TIMEOUT)
+    return version
+
+
+async def aterm_version(semester) -> int:
+    key = term_version_key(semester)
+    version = await cache.aget(key)
+    if version is None:
+        version = (
+            await CatalogVersion.objects.using(DEFAULT_DB_ALIAS)
+            .filter(semester=semester)
+            .values_list("version", flat=True)
+            .afirst()
+        ) or 0
+        await cache.aset(key, version, TERM_VERSION_TIMEOUT)
+    return version
+
+
+def invalidate_term(semester):
+    # a clock value rather than a counter, so a version is never handed out twice
+    version = time.time_ns()
+    CatalogVersion.objects.update_or_create(
+        semester=semester, defaults={"version": version}
+    )
+    # saves the next request a query; it would read the same from the primary
+    cache.set(term_version_key(semester), version, TERM_VERSION_TIMEOUT)
+
+
+def search_key(cleaned_data, cursor=None, version=None) -> str:
+    # forms that differ only in case or spacing share an entry
+    semester = cleaned_data.get("semester") or ""
+    if version is None:
+        version = term_version(semester)
+    normalized = {
+        "subject": (cleaned_data.get("subject") or "").upper(),
+        "catalog_number": (cleaned_data.get("catalog_number") or "").strip(),
+        "keyword": " ".join((cleaned_data.get("keyword") or "").lower().split()),
+        "cursor": cursor or "",
+    }
+    digest = hashlib.sha256(json.dumps(normalized, sort_keys=True).encode())
+    return f"search:{semester}:{version}:{digest.hexdigest()}"
+
+
+def cached_search(cleaned_data, cursor=None):
+    """paginate(ClassSearchForm.get_results_from_database(...)), cached per term."""
+    key = search_key(cleaned_data, cursor)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+    subject = cleaned_data.get("subject")
+    if subject and subject not in term_subjects(cleaned_data.get("semester")):
+        page = [], None
+    else:
+        page = paginate(catalog_query(cleaned_data), cursor)
+    cache.set(key, page)
+    return page
+
+
+async def acached_search(cleaned_data, cursor=None):
+    semester = cleaned_data.get("semester") or ""
+    key = search_key(cleaned_data, cursor, await aterm_version(semester))
+    cached = await cache.aget(key)
+    if cached is not None:
+        return cached
+    subject = cleaned_data.get("subject")
+    if subject and subject not in await aterm_subjects(semester):
+        page = [], None
+    else:
+        # building the queryset may introspect the database for the keyword index
+        classes = await sync_to_async(catalog_query)(cleaned_data)
+        page = await apaginate(classes, cursor)
+    await cache.aset(key, page)
+    return page
+
+
+def catalog_query(cleaned_data):
+    return ClassSearchForm.get_results_from_database(cleaned_data).using(
+        DEFAULT_DB_ALIAS
+    )
+
+
+def subjects_query(semester):
+    return (
+        Class.objects.using(DEFAULT_DB_ALIAS)
+        .filter(semester=semester)
+        .order_by("subject")
+        .values_list("subject", flat=True)
+        .distinct()
+    )
+
+
+def term_subjects(semester) -> list:
+    """Subjects with at least one class in the term."""
+    key = f"subjects:{semester}:{term_version(semester)}"
+    subjects = cache.get(key)
+    if subjects is None:
+        subjects = list(subjects_query(semester))
+        cache.set(key, subjects)
+    return subjects
+
+
+async def aterm_subjects(semester) -> list:
+    key = f"subjects:{semester}:{await aterm_version(semester)}"
+    subjects = await cache.aget(key)
+    if subjects is None:
+        subjects = [subject async for subject in subjects_query(semester)]
+        await cache.aset(key, subjects)
+    return subjects
+
+
+CARD_BODY_TEMPLATE = "schedule_advisor/class_card_body.html"
+
+
+def card_key(cl) -> str:
+    # source_hash changes whenever an ingest rewrites the row
+    return f"class-card:{cl.id}:{cl.source_hash}"
+
+
+def render_card_bodies(classes):
+    """Sets card_body on each class to its rendered class_card_body.html, fetching
+    all of them in one cache round trip and rendering only the ones missing.
+
+    The body is the same for every user; the action buttons are rendered live."""
+    classes = list(classes)
+    bodies = cache.get_many([card_key(cl) for cl in classes])
+    rendered = {}
+    for cl in classes:
+        key = card_key(cl)
+        if key not in bodies:
+            bodies[key] = rendered[key] = render_to_string(
+                CARD_BODY_TEMPLATE, {"result": cl}
+            )
+        cl.card_body = mark_safe(bodies[key])
+    if rendered:
+        cache.set_many(rendered)
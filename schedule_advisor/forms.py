@@ -1,12 +1,13 @@
-import requests
+import re
+
 from django import forms
 from django.core.validators import RegexValidator
 from django.forms import ModelForm
 from django.db import models
 
 from schedule_advisor.models import Class, User
-from schedule_advisor.settings import SIS_API_URL
-
+from schedule_advisor.search import RESULT_ORDER, filter_keywords
+from schedule_advisor.sis import get_client
 
 # Retrieved from https://docs.djangoproject.com/en/4.1/topics/forms/modelforms/
 # Retrieved from https://stackoverflow.com/questions/11923317/creating-django-forms
@@ -28,21 +29,15 @@ class ClassSearchForm(forms.Form):
     @staticmethod
     def get_results(cleaned_data, pages=None):
         # cleaned_data: e.g. {'semester': '1238', 'subject': 'KOR', 'keyword': 'Elementary'}
-        url_parts = [SIS_API_URL]
+        params = {}
         if cleaned_data.get("semester", ""):
-            url_parts.append(f"term={cleaned_data['semester']}")
+            params["term"] = cleaned_data["semester"]
         if cleaned_data.get("subject", ""):
-            url_parts.append(f"subject={cleaned_data['subject']}")
+            params["subject"] = cleaned_data["subject"]
         if cleaned_data.get("catalog_number", ""):
-            url_parts.append(f"catalog_nbr={cleaned_data['catalog_number']}")
-        url = "&".join(url_parts)
+            params["catalog_nbr"] = cleaned_data["catalog_number"]
         results = []
-        current_page = 0
-        while pages is None or current_page < pages:
-            current_page += 1
-            page_results = requests.get(f"{url}&page={str(current_page)}").json()
-            if not page_results:
-                break
+        for page_results in get_client().pages(limit=pages, **params):
             results += page_results
         # print(cleaned_data)
 
@@ -64,7 +59,7 @@ class ClassSearchForm(forms.Form):
 
     @staticmethod
     def get_results_from_database(cleaned_data):
-        classes = Class.objects
+        classes = Class.objects.for_cards()
         if cleaned_data.get("semester", ""):
             classes = classes.filter(semester=cleaned_data["semester"])
         if cleaned_data.get("subject", ""):
@@ -72,24 +67,8 @@ class ClassSearchForm(forms.Form):
         if cleaned_data.get("catalog_number", ""):
             classes = classes.filter(catalog_number=cleaned_data["catalog_number"])
         if cleaned_data.get("keyword", "") != "":
-            keywords = cleaned_data["keyword"].split()
-            new_results = []
-            for course in classes:
-                if all([kwd.lower() in course.name.lower() for kwd in keywords]):
-                    new_results.append(course)
-            return sorted(
-                new_results,
-                key=lambda c: (
-                    c.subject,
-                    c.catalog_number,
-                    c.class_section,
-                    c.component,
-                ),
-            )
-        return sorted(
-            list(classes),
-            key=lambda c: (c.subject, c.catalog_number, c.class_section, c.component),
-        )
+            classes = filter_keywords(classes, cleaned_data["keyword"].split())
+        return classes.order_by(*RESULT_ORDER)
 
     SEMESTER_CHOICES = [
         ("1238", "Fall 2023"),
@@ -349,3 +328,50 @@ class ClassSearchForm(forms.Form):
 
 class AdviseeChoiceForm(forms.Form):
     user = forms.ModelChoiceField(queryset=User.objects.all())
+
+
+class ScheduleGeneratorForm(forms.Form):
+    course_regex = r"([A-Za-z]{2,4})\s*(\d{4})"
+    courses_regex_validator = RegexValidator(
+        rf"^\s*{course_regex}(\s*,\s*{course_regex})*\s*$",
+        "List courses as subject and catalog number, e.g. CS 2100, APMA 3080",
+    )
+
+    semester = forms.ChoiceField(
+        label="Semester",
+        choices=ClassSearchForm.SEMESTER_CHOICES,
+        initial=ClassSearchForm.SEMESTER_CHOICES[0][0],
+        required=False,
+    )
+
+    courses = forms.CharField(
+        label="Courses",
+        max_length=200,
+        validators=[courses_regex_validator],
+    )
+
+    avoid_mornings = forms.BooleanField(label="Avoid early mornings", required=False)
+
+    compact = forms.BooleanField(label="Fewer days on campus", required=False)
+
+    limit = forms.IntegerField(
+        label="Schedules", min_value=1, max_value=50, required=False
+    )
+
+    def clean_semester(self):
+        return self.cleaned_data["semester"] or ClassSearchForm.SEMESTER_CHOICES[0][0]
+
+    def clean_courses(self):
+        # e.g. "cs 2100, APMA3080" -> [("CS", "2100"), ("APMA", "3080")]
+        courses = []
+        for subject, catalog_number in re.findall(
+            self.course_regex, self.cleaned_data["courses"]
+        ):
+            if (subject.upper(), catalog_number) not in courses:
+                courses.append((subject.upper(), catalog_number))
+        if len(courses) > 8:
+            raise forms.ValidationError("Choose at most 8 courses.")
+        return courses
+
+    def clean_limit(self):
+        return self.cleaned_data["limit"] or 10
@@ -0,0 +1,229 @@
+import heapq
+from itertools import count
+
+from django.db.models import Q
+
+from schedule_advisor.conflicts import block_minutes
+from schedule_advisor.models import Class
+
+MINUTES_PER_DAY = 24 * 60
+
+# The minutes of one day in a week_mask, shifted to Sunday
+DAY = (1 << MINUTES_PER_DAY) - 1
+
+# Meetings starting before this minute of the day count as early mornings
+MORNING_CUTOFF = 10 * 60
+
+# best() stops after scoring this many valid schedules, keeping the best ones seen
+MAX_SOLUTIONS = 20000
+
+
+def week_mask(cl) -> int:
+    # one bit per minute of the week, Sunday 00:00 first
+    mask = 0
+    for day_mask, start, end in cl.meeting_blocks:
+        minutes = block_minutes(start, end)
+        for day in range(7):
+            if day_mask & (1 << day):
+                mask |= minutes << (day * MINUTES_PER_DAY)
+    return mask
+
+
+class Option:
+    """Sections of one course component that meet at exactly the same times;
+    any of them can fill the slot, so the solver only tries one."""
+
+    def __init__(self, mask, sections):
+        self.mask = mask
+        self.sections = sections
+
+
+class ScheduleGenerator:
+    """Finds non-conflicting sets of sections for a list of courses.
+
+    Every component of a course (lecture, discussion, lab, ...) needs one open
+    section. Components are filled in order of fewest options, and after each
+    choice the remaining components' options are filtered down to those that
+    still fit, so dead ends are abandoned as early as possible. best() also
+    skips branches that can't score better than the schedules it already has.
+
+    generator = ScheduleGenerator("1238", [("CS", "2100"), ("APMA", "3080")])
+    for score, options in generator.best(10):
+        ...
+    """
+
+    def __init__(self, semester, courses, avoid_mornings=False, compact=False):
+        self.semester = semester
+        self.courses = courses
+        self.avoid_mornings = avoid_mornings
+        self.compact = compact
+        self.missing = []
+        self.slots = self.load_slots()
+
+    def load_slots(self):
+        query = Q()
+        for subject, catalog_number in self.courses:
+            query |= Q(subject=subject, catalog_number=catalog_number)
+        sections = (
+            Class.objects.for_cards()
+            .filter(query, semester=self.semester)
+            .order_by("subject", "catalog_number", "component", "class_section")
+        )
+        # closed sections are grouped too, so a component whose sections are all
+        # closed is reported rather than silently left out of the schedules
+        slots = {}
+        for cl in sections:
+            key = (cl.subject, cl.catalog_number, cl.component)
+            options = slots.setdefault(key, {})
+            if cl.enrl_stat != "C":
+                options.setdefault(week_mask(cl), []).append(cl)
+        found = {(subject, catalog_number) for subject, catalog_number, _ in slots}
+        # (subject, catalog_number) of courses without any sections, then
+        # (subject, catalog_number, component) of components without open ones
+        self.missing = [course for course in self.courses if course not in found]
+        self.missing += [key for key, options in slots.items() if not options]
+        return [
+            [Option(mask, sections) for mask, sections in options.items()]
+            for options in slots.values()
+        ]
+
+    def solutions(self):
+        """Yields every valid schedule as a list of Options, one per slot."""
+        if self.missing or not self.slots:
+            return
+        yield from self.search(0, [], sorted(self.slots, key=len))
+
+    def search(self, occupied, chosen, remaining):
+        if not remaining:
+            yield list(chosen)
+            return
+        slot, rest = remaining[0], remaining[1:]
+        for option in slot:
+            if option.mask & occupied:
+                continue
+            taken = occupied | option.mask
+            # forward check: drop options that clash, give up if a slot runs dry
+            narrowed = []
+            for other in rest:
+                fitting = [o for o in other if not o.mask & taken]
+                if not fitting:
+                    break
+                narrowed.append(fitting)
+            else:
+                chosen.append(option)
+                yield from self.search(taken, chosen, sorted(narrowed, key=len))
+                chosen.pop()
+
+    def score(self, options) -> int:
+        # lower is better
+        mask = 0
+        for option in options:
+            mask |= option.mask
+        bound, gaps = self.costs(mask)
+        return bound + gaps.bit_count()
+
+    def costs(self, mask):
+        """The score of ``mask`` without gaps, and the gaps (free minutes
+        between the first and last meeting of each day) as a mask. The morning
+        penalty and the day count only grow as options are added, but a later
+        option may fill a gap, so no schedule containing ``mask`` can score
+        less than the first."""
+        score = 0
+        gaps = 0
+        for day in range(7):
+            minutes = (mask >> (day * MINUTES_PER_DAY)) & DAY
+            if not minutes:
+                continue
+            first = (minutes & -minutes).bit_length() - 1
+            if self.avoid_mornings and first < MORNING_CUTOFF:
+                score += MORNING_CUTOFF - first
+            if self.compact:
+                # an extra day on campus costs as much as two hours of gaps
+                score += 120
+                span = (1 << minutes.bit_length()) - (1 << first)
+                gaps |= (span & ~minutes) << (day * MINUTES_PER_DAY)
+        return score, gaps
+
+    @staticmethod
+    def unfillable(gaps, slots) -> int:
+        # Gap minutes no choice of the remaining slots' options could fill: each
+        # slot fills at most what its best option covers, and nothing outside
+        # the options at all.
+        fillable = 0
+        most_filled = 0
+        for slot in slots:
+            fills = 0
+            for option in slot:
+                fillable |= option.mask
+                filled = option.mask & gaps
+                if filled:
+                    fills = max(fills, filled.bit_count())
+            most_filled += fills
+        return max(gaps.bit_count() - most_filled, (gaps & ~fillable).bit_count())
+
+    def best(self, limit, max_solutions=MAX_SOLUTIONS):
+        """Returns up to ``limit`` (score, options) pairs, best first.
+
+        A branch and bound search: each slot's options are tried cheapest
+        first, and a branch is abandoned as soon as its lower bound can't beat
+        the worst of the ``limit`` best schedules found so far."""
+        if self.missing or not self.slots or limit < 1:
+            return []
+        # the worst kept schedule on top: highest score, then latest found
+        ranked = []
+        found = count()
+        # Courses whose options meet at the same times (e.g. cross-listed ones)
+        # are interchangeable: their options are taken in increasing mask order,
+        # so the same times aren't searched again with the courses swapped.
+        floors = {}
+
+        def search(occupied, chosen, remaining):
+            # returns False once max_solutions schedules have been scored
+            if not remaining:
+                order = next(found)
+                entry = (-self.score(chosen), -order, list(chosen))
+                if len(ranked) < limit:
+                    heapq.heappush(ranked, entry)
+                else:
+                    heapq.heappushpop(ranked, entry)
+                return order + 1 < max_solutions
+            (times, slot), rest = remaining[0], remaining[1:]
+            floor = floors.get(times, 0)
+            candidates = []
+            for option in slot:
+                if not option.mask & occupied and option.mask >= floor:
+                    taken = occupied | option.mask
+                    candidates.append((*self.costs(taken), option, taken))
+            candidates.sort(key=lambda candidate: candidate[0])
+            for bound, gaps, option, taken in candidates:
+                if len(ranked) == limit and bound >= -ranked[0][0]:
+                    break  # neither this option nor the costlier ones can do better
+                # forward check: drop options that clash, give up if a slot runs dry
+                narrowed = []
+                for other_times, other in rest:
+                    fitting = [o for o in other if not o.mask & taken]
+                    if not fitting:
+                        break
+                    narrowed.append((other_times, fitting))
+                else:
+                    if gaps:
+                        bound += self.unfillable(gaps, [o for _, o in narrowed])
+                    if len(ranked) == limit and bound >= -ranked[0][0]:
+                        continue
+                    chosen.append(option)
+                    floors[times] = option.mask
+                    going = search(
+                        taken, chosen, sorted(narrowed, key=lambda s: len(s[1]))
+                    )
+                    floors[times] = floor
+                    chosen.pop()
+                    if not going:
+                        return False
+            return True
+
+        slots = [(frozenset(o.mask for o in slot), slot) for slot in self.slots]
+        search(0, [], sorted(slots, key=lambda s: len(s[1])))
+        return [
+            (-score, options)
+            for score, _, options in sorted(ranked, key=lambda e: (-e[0], -e[1]))
+        ]
@@ -0,0 +1,163 @@
+import json
+import time
+
+from django.db import transaction
+from django.utils import timezone
+
+from schedule_advisor.cache import invalidate_term
+from schedule_advisor.models import DERIVED_FIELDS, Class, hash_source_data
+from schedule_advisor.sis import get_client
+
+# Size of the pages read back from a JSON-lines dump
+DUMP_PAGE_SIZE = 100
+
+# Columns rewritten when a class that is already in the database shows up in SIS again.
+UPDATE_FIELDS = (
+    [
+        "name",
+        "source_data",
+        "subject",
+        "catalog_number",
+        "class_section",
+        "component",
+        "units",
+    ]
+    + DERIVED_FIELDS
+    + ["enrollment_updated_at"]
+)
+
+
+class Ingest:
+    """Writes SIS results for one semester (or one subject of it) to the database,
+    one page at a time."""
+
+    def __init__(self, semester, subject=None):
+        self.semester = semester
+        self.subject = subject
+        # the only state kept across pages, so memory stays flat however big the term is
+        self.seen = set()
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.deleted = 0
+        self.started = time.perf_counter()
+
+    def write_page(self, page_results):
+        # only the raw results are hashed up front; the derived fields are
+        # computed for the rows that are actually written
+        hashes = [hash_source_data(result) for result in page_results]
+        class_numbers = [result["class_nbr"] for result in page_results]
+        self.seen.update(class_numbers)
+        stored_hashes = dict(
+            Class.objects.filter(
+                semester=self.semester, class_number__in=class_numbers
+            ).values_list("class_number", "source_hash")
+        )
+        changed = []
+        for result, source_hash in zip(page_results, hashes):
+            if result["class_nbr"] not in stored_hashes:
+                self.inserted += 1
+            elif stored_hashes[result["class_nbr"]] != source_hash:
+                self.updated += 1
+            else:
+                self.unchanged += 1
+                continue
+            changed.append(Class.from_sis(result))
+        if not changed:
+            return
+        now = timezone.now()
+        for cl in changed:
+            cl.enrollment_updated_at = now
+        # Retrieved from https://docs.djangoproject.com/en/4.1/ref/models/querysets/#bulk-create
+        with transaction.atomic():
+            Class.objects.bulk_create(
+                changed,
+                update_conflicts=True,
+                unique_fields=["semester", "class_number"],
+                update_fields=UPDATE_FIELDS,
+            )
+        invalidate_term(self.semester)
+
+    @property
+    def written(self):
+        return self.inserted + self.updated
+
+    def scope(self):
+        classes = Class.objects.filter(semester=self.semester)
+        if self.subject:
+            classes = classes.filter(subject=self.subject)
+        return classes
+
+    def delete_stale(self):
+        in_database = set(self.scope().values_list("class_number", flat=True))
+        stale = in_database.difference(self.seen)
+        if not stale:
+            return
+        with transaction.atomic():
+            deleted = Class.objects.filter(
+                semester=self.semester, class_number__in=stale
+            ).delete()[1]
+        self.deleted = deleted.get(Class._meta.label, 0)
+        invalidate_term(self.semester)
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def summary(self):
+        elapsed = self.elapsed
+        rate = len(self.seen) / elapsed if elapsed else 0
+        label = f"{self.semester} {self.subject}" if self.subject else self.semester
+        return (
+            f"{label}: {self.inserted} inserted, {self.updated} updated, "
+            f"{self.unchanged} unchanged, {self.deleted} deleted "
+            f"in {elapsed:.2f}s ({rate:.0f} rows/sec)"
+        )
+
+
+def read_dump(path, term, subject=None, page_size=DUMP_PAGE_SIZE):
+    """Yields pages of the classes in a JSON-lines dump (one SIS class per line)
+    that belong to the given term and subject, without reading the whole file."""
+    page = []
+    with open(path) as dump:
+        for line in dump:
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            if result["strm"] != term or (subject and result["subject"] != subject):
+                continue
+            page.append(result)
+            if len(page) == page_size:
+                yield page
+                page = []
+    if page:
+        yield page
+
+
+def write_dump(path, page_results):
+    # one write per page in append mode, so shards in other processes don't interleave lines
+    lines = "".join(json.dumps(result) + "\n" for result in page_results)
+    with open(path, "a") as dump:
+        dump.write(lines)
+
+
+def ingest_shard(semester, subject=None, source=None, dump=None):
+    """Crawls and writes one (semester, subject) shard; runs in a worker process
+    when get_data_from_sis is given --workers.
+
+    Pages are read from SIS, or replayed from the JSON-lines file ``source``,
+    and appended to the JSON-lines file ``dump`` as they are written."""
+    ingest = Ingest(semester, subject)
+    if source:
+        pages = read_dump(source, semester, subject)
+    else:
+        params = {"term": semester}
+        if subject:
+            params["subject"] = subject
+        pages = get_client().pages(**params)
+    for page_results in pages:
+        if dump:
+            write_dump(dump, page_results)
+        ingest.write_page(page_results)
+    ingest.delete_stale()
+    return ingest.summary()
@@ -0,0 +1,157 @@
+import json
+import logging
+import random
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+logger = logging.getLogger("schedule_advisor.requests")
+
+# Metrics of the request being handled, if it was sampled. Context variables
+# follow the request into sync_to_async threads, so queries run by async views
+# are counted too.
+current_metrics = ContextVar("current_metrics", default=None)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.query_count = 0
+        self.query_time = 0.0
+        self.queries = {}  # sql: [count, seconds]
+        self.template_time = 0.0
+        self.template_depth = 0
+
+    def add_query(self, sql, duration):
+        self.query_count += 1
+        self.query_time += duration
+        count_time = self.queries.setdefault(sql, [0, 0.0])
+        count_time[0] += 1
+        count_time[1] += duration
+
+    def duplicates(self) -> list:
+        # same SQL (parameters are placeholders) run more than once, worst first
+        return sorted(
+            (
+                {"sql": sql, "count": count, "ms": round(seconds * 1000, 2)}
+                for sql, (count, seconds) in self.queries.items()
+                if count > 1
+            ),
+            key=lambda duplicate: -duplicate["count"],
+        )
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.add_query(sql, time.perf_counter() - started)
+
+
+def install_query_recorder(connection, **kwargs):
+    # Connected to connection_created; execute_wrappers outlive reconnects
+    # Retrieved from https://docs.djangoproject.com/en/4.1/topics/db/instrumentation/
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class InstrumentedTemplate(Template):
+    def render(self, context=None, request=None):
+        metrics = current_metrics.get()
+        if metrics is None:
+            return super().render(context, request)
+        # templates rendered from inside another one are already being timed
+        metrics.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics.template_depth -= 1
+            if not metrics.template_depth:
+                metrics.template_time += time.perf_counter() - started
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, timing every render for RequestMetrics."""
+
+    def from_string(self, template_code):
+        return InstrumentedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return InstrumentedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+class RequestMetricsMiddleware:
+    """Records SQL query count and time, template time and total latency of a
+    sample of requests, and reports them in a Server-Timing header and one JSON
+    log line per request. Requests slower than REQUEST_METRICS_SLOW_MS are also
+    logged as warnings with their duplicated queries."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if random.random() >= settings.REQUEST_METRICS_SAMPLE_RATE:
+            return self.get_response(request)
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.report(metrics, request, response)
+
+    async def __acall__(self, request):
+        if random.random() >= settings.REQUEST_METRICS_SAMPLE_RATE:
+            return await self.get_response(request)
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.report(metrics, request, response)
+
+    @staticmethod
+    def report(metrics, request, response):
+        total = time.perf_counter() - metrics.started
+        # Retrieved from https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/Server-Timing
+        response.headers["Server-Timing"] = (
+            f'db;dur={metrics.query_time * 1000:.1f};desc="{metrics.query_count} queries", '
+            f"tpl;dur={metrics.template_time * 1000:.1f}, "
+            f"total;dur={total * 1000:.1f}"
+        )
+        match = getattr(request, "resolver_match", None)
+        record = {
+            "view": match.view_name if match else None,
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "queries": metrics.query_count,
+            "db_ms": round(metrics.query_time * 1000, 2),
+            "template_ms": round(metrics.template_time * 1000, 2),
+            "total_ms": round(total * 1000, 2),
+        }
+        logger.info(json.dumps(record))
+        if total * 1000 >= settings.REQUEST_METRICS_SLOW_MS:
+            record["duplicate_queries"] = metrics.duplicates()
+            logger.warning(json.dumps({"slow_request": record}))
+        return response
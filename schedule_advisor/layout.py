@@ -0,0 +1,118 @@
+from django.core.cache import cache
+
+from schedule_advisor.models import DAY_ABBREVIATIONS
+
+DAYS_OF_WEEK = [
+    "Sunday",
+    "Monday",
+    "Tuesday",
+    "Wednesday",
+    "Thursday",
+    "Friday",
+    "Saturday",
+]
+
+# Layouts only change with the schedule, so they can live for a long time
+LAYOUT_TIMEOUT = 24 * 60 * 60
+
+
+def layout_key(schedule) -> str:
+    return f"schedule-layout:{schedule.id}:{schedule.version}"
+
+
+def compute_layout(classes) -> dict:
+    # {"days": [[class ids ordered by start time], ...one per day],
+    #  "other": [class ids without meeting times], "hashes": {class id: source_hash}}
+    days = [[] for _ in DAY_ABBREVIATIONS]
+    other = []
+    for cl in classes:
+        starts = {}
+        for day_mask, start, end in cl.meeting_blocks:
+            if not day_mask:
+                other.append((cl.name, cl.id))
+            for day in range(7):
+                if day_mask & (1 << day):
+                    starts[day] = min(start, starts.get(day, start))
+        for day, start in starts.items():
+            days[day].append((start, cl.name, cl.id))
+    return {
+        "days": [[entry[-1] for entry in sorted(day)] for day in days],
+        "other": [class_id for _, class_id in sorted(set(other))],
+        "hashes": {cl.id: cl.source_hash for cl in classes},
+    }
+
+
+def schedule_layout(schedule) -> list:
+    """Classes of a schedule grouped by day for schedule.html.
+
+    Returns [{"name": "Sunday", "id": "Sunday", "classes": [...]}, ...] with
+    classes in order of their first meeting that day, followed by an "Other"
+    entry when some classes have no meeting times. The grouping is cached per
+    schedule version, so only the class cards themselves are loaded per request.
+    """
+    classes = {cl.id: cl for cl in schedule.classes.for_cards()}
+    key = layout_key(schedule)
+    layout = cache.get(key)
+    if is_stale(layout, classes):
+        layout = compute_layout(classes.values())
+        cache.set(key, layout, LAYOUT_TIMEOUT)
+    return arrange(layout, classes)
+
+
+async def aschedule_layout(schedule) -> list:
+    classes = {cl.id: cl async for cl in schedule.classes.for_cards()}
+    key = layout_key(schedule)
+    layout = await cache.aget(key)
+    if is_stale(layout, classes):
+        layout = compute_layout(classes.values())
+        await cache.aset(key, layout, LAYOUT_TIMEOUT)
+    return arrange(layout, classes)
+
+
+def schedule_layouts(schedules) -> dict:
+    """schedule_layout for many schedules at once: {schedule id: layout}.
+
+    The schedules' classes should be prefetched with for_cards(); cached
+    layouts are fetched in one round trip and only the missing ones computed."""
+    classes = {
+        schedule.id: {cl.id: cl for cl in schedule.classes.all()}
+        for schedule in schedules
+    }
+    keys = {schedule.id: layout_key(schedule) for schedule in schedules}
+    cached = cache.get_many(keys.values())
+    computed = {}
+    layouts = {}
+    for schedule_id, key in keys.items():
+        layout = cached.get(key)
+        if is_stale(layout, classes[schedule_id]):
+            layout = computed[key] = compute_layout(classes[schedule_id].values())
+        layouts[schedule_id] = arrange(layout, classes[schedule_id])
+    if computed:
+        cache.set_many(computed, LAYOUT_TIMEOUT)
+    return layouts
+
+
+def is_stale(layout, classes) -> bool:
+    # new schedule version, or a class's meetings were re-ingested
+    current = {class_id: cl.source_hash for class_id, cl in classes.items()}
+    return layout is None or layout["hashes"] != current
+
+
+def arrange(layout, classes) -> list:
+    days = [
+        {
+            "name": name,
+            "id": name,
+            "classes": [classes[class_id] for class_id in class_ids],
+        }
+        for name, class_ids in zip(DAYS_OF_WEEK, layout["days"])
+    ]
+    if layout["other"]:
+        days.append(
+            {
+                "name": "Other",
+                "id": "na",
+                "classes": [classes[class_id] for class_id in layout["other"]],
+            }
+        )
+    return days
@@ -0,0 +1,102 @@
+import json
+import platform
+import subprocess
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from schedule_advisor.benchmark import SIZES, Benchmark, compare
+
+# A cache of its own, so the benchmark never clears or fills the site's cache
+BENCHMARK_CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "benchmark",
+    }
+}
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Times search, conflict checks, the schedule and advisor views and the "
+        "ingest command against synthetic catalogs, in a scratch database, and "
+        "writes the results as JSON. No network access is needed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            nargs="+",
+            type=int,
+            default=SIZES,
+            help="Catalog sizes in sections (default: 1000 10000 50000)",
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=5, help="Runs of each benchmark"
+        )
+        parser.add_argument(
+            "--output", default=None, help="Write the JSON here instead of stdout"
+        )
+        parser.add_argument(
+            "--compare",
+            default=None,
+            metavar="BASELINE",
+            help="Print the change in median time from an earlier --output file",
+        )
+
+    def handle(self, *args, **options):
+        # the same throwaway database the test runner uses, so nothing real is touched
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False
+        )
+        try:
+            # create_test_db only redirects the default database, so reads must
+            # not be routed to a replica
+            with override_settings(
+                CACHES=BENCHMARK_CACHES,
+                ALLOWED_HOSTS=["testserver"],
+                DATABASE_REPLICAS=[],
+            ):
+                results = {}
+                for size in options["sizes"]:
+                    self.stderr.write(f"benchmarking {size} sections...")
+                    results[str(size)] = Benchmark(size, options["repeat"]).run()
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+        report = {
+            "created_at": timezone.now().isoformat(),
+            "commit": current_commit(),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "database": connection.vendor,
+            "repeat": options["repeat"],
+            "results": results,
+        }
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as file:
+                file.write(output + "\n")
+        else:
+            self.stdout.write(output)
+        if options["compare"]:
+            with open(options["compare"]) as file:
+                baseline = json.load(file)
+            out = self.stderr if not options["output"] else self.stdout
+            for size, name, before, after in compare(baseline, report):
+                change = (after - before) / before * 100 if before else 0
+                out.write(
+                    f"{size:>6} {name:<24} {before:>10.2f}ms -> {after:>10.2f}ms "
+                    f"({change:+.0f}%)"
+                )
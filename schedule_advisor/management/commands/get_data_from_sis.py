@@ -1,44 +1,88 @@
-from django.core.management.base import BaseCommand
-from schedule_advisor.settings import SIS_API_URL
-from schedule_advisor.forms import ClassSearchForm
-from schedule_advisor.models import Class
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-import requests
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from schedule_advisor.forms import ClassSearchForm
+from schedule_advisor.ingest import ingest_shard
 
 
 class Command(BaseCommand):
     help = "Gets data from SIS and saves it to the database."
 
-    def handle(self, *args, **kwargs):
-        current_semester = ClassSearchForm.SEMESTER_CHOICES[0][0]
-        url = SIS_API_URL + f"&term={current_semester}"
-        current_page = 0
-        results = []
-        all_classes_for_term = Class.objects.filter(semester=current_semester)
-        class_numbers_db = {db_class.class_number for db_class in all_classes_for_term}
-        while True:
-            current_page += 1
-            page_results = requests.get(f"{url}&page={str(current_page)}").json()
-            if not page_results:
-                break
-            results += page_results
-            for result in page_results:
-                db_equivalent = Class.objects.get_or_create(
-                    semester=result["strm"], class_number=result["class_nbr"]
-                )[0]
-                # if result == db_equivalent.source_data:
-                #     continue
-                db_equivalent.subject = result["subject"]
-                db_equivalent.catalog_number = result["catalog_nbr"]
-                db_equivalent.class_section = result["class_section"]
-                db_equivalent.component = result["component"]
-                db_equivalent.units = result["units"]
-                db_equivalent.source_data = result
-                db_equivalent.name = result["descr"]
-                db_equivalent.save()
-        class_numbers_api = {api_class["class_nbr"] for api_class in results}
-        classes_to_delete = class_numbers_db.difference(class_numbers_api)
-        for class_to_delete in classes_to_delete:
-            db_class = Class.objects.get(class_number=class_to_delete)
-            db_class.delete()
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--terms",
+            nargs="+",
+            default=[ClassSearchForm.SEMESTER_CHOICES[0][0]],
+            help="Terms to refresh, e.g. 1238 1236 (default: the current semester)",
+        )
+        parser.add_argument(
+            "--subjects",
+            nargs="+",
+            default=None,
+            help="Subjects to crawl as separate shards, or 'all' for every subject "
+            "(default: crawl each term as a whole)",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Number of processes the shards are spread across",
+        )
+        parser.add_argument(
+            "--from-file",
+            default=None,
+            help="Replay classes from a JSON-lines dump instead of calling SIS",
+        )
+        parser.add_argument(
+            "--dump",
+            default=None,
+            help="Record every class that is read to this JSON-lines file",
+        )
+
+    def handle(self, *args, **options):
+        subjects = options["subjects"] or [None]
+        if subjects == ["all"]:
+            subjects = [subject for subject, _ in ClassSearchForm.SUBJECT_CHOICES]
+        shards = [
+            (term, subject, options["from_file"], options["dump"])
+            for term in options["terms"]
+            for subject in subjects
+        ]
+        if options["dump"]:
+            open(options["dump"], "w").close()
+        started = time.perf_counter()
+        failed = 0
+        for (term, subject, _, _), outcome in self.run_shards(
+            shards, options["workers"]
+        ):
+            if isinstance(outcome, Exception):
+                failed += 1
+                self.stderr.write(f"{term} {subject or ''}: failed ({outcome!r})")
+            else:
+                self.stdout.write(outcome)
+        self.stdout.write(
+            f"{len(shards) - failed}/{len(shards)} shards refreshed "
+            f"in {time.perf_counter() - started:.2f}s"
+        )
+        if failed:
+            raise CommandError(f"{failed} shard(s) failed")
 
+    @staticmethod
+    def run_shards(shards, workers):
+        # each shard is written on its own, so a failing subject only loses that subject
+        if workers <= 1:
+            for shard in shards:
+                try:
+                    yield shard, ingest_shard(*shard)
+                except Exception as e:
+                    yield shard, e
+            return
+        # forked workers must not reuse the parent's database connections
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as pool:
+            futures = {pool.submit(ingest_shard, *shard): shard for shard in shards}
+            for future in as_completed(futures):
+                yield futures[future], future.exception() or future.result()
@@ -0,0 +1,161 @@
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+# How each mode is launched by --compare; "asgi" matches the Procfile
+SERVERS = {
+    "wsgi": ["schedule_advisor.wsgi:application"],
+    "asgi": [
+        "schedule_advisor.asgi:application",
+        "--worker-class",
+        "uvicorn.workers.UvicornWorker",
+    ],
+}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = (
+        "Sends concurrent requests to the site and reports throughput and latency. "
+        "With --compare, starts gunicorn once with sync (WSGI) workers and once "
+        "with uvicorn (ASGI) workers and load tests both."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "urls",
+            nargs="+",
+            help="URLs, or paths like /api/classes?term=1238 with --compare, "
+            "requested in turn",
+        )
+        parser.add_argument("--requests", type=int, default=1000)
+        parser.add_argument("--concurrency", type=int, default=50)
+        parser.add_argument(
+            "--post",
+            nargs="+",
+            default=None,
+            metavar="FIELD=VALUE",
+            help="POST this form data (with a CSRF token) instead of GET, "
+            "e.g. semester=1238 subject=CS",
+        )
+        parser.add_argument(
+            "--compare",
+            action="store_true",
+            help="Start a local server in each mode instead of using running ones",
+        )
+        parser.add_argument(
+            "--workers", type=int, default=2, help="gunicorn workers for --compare"
+        )
+
+    def handle(self, *args, **options):
+        data = None
+        if options["post"]:
+            data = dict(field.split("=", 1) for field in options["post"])
+        if not options["compare"]:
+            self.report("", self.load(options["urls"], data, options))
+            return
+        for mode, app in SERVERS.items():
+            port = free_port()
+            base = f"http://127.0.0.1:{port}"
+            command = [
+                sys.executable,
+                "-m",
+                "gunicorn",
+                *app,
+                "--bind",
+                f"127.0.0.1:{port}",
+                "--workers",
+                str(options["workers"]),
+            ]
+            server = subprocess.Popen(
+                command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
+            try:
+                urls = [urljoin(base, url) for url in options["urls"]]
+                self.wait_for(server, urls[0])
+                self.report(f"{mode}: ", self.load(urls, data, options))
+            finally:
+                server.terminate()
+                server.wait()
+
+    @staticmethod
+    def wait_for(server, url, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f"server exited with status {server.returncode}")
+            try:
+                requests.get(url, timeout=5)
+                return
+            except requests.RequestException:
+                time.sleep(0.2)
+        raise CommandError(f"server did not start within {timeout}s")
+
+    @staticmethod
+    def load(urls, data, options):
+        local = threading.local()
+
+        def session():
+            # one keep-alive session per thread; requests.Session isn't thread-safe
+            if not hasattr(local, "session"):
+                local.session = requests.Session()
+                if data is not None:
+                    local.session.get(urls[0])
+            return local.session
+
+        def send(i):
+            url = urls[i % len(urls)]
+            started = time.perf_counter()
+            try:
+                if data is None:
+                    response = session().get(url)
+                else:
+                    s = session()
+                    response = s.post(
+                        url,
+                        data=data,
+                        headers={
+                            "X-CSRFToken": s.cookies.get("csrftoken", ""),
+                            "Referer": url,
+                        },
+                    )
+                ok = response.status_code < 400
+            except requests.RequestException:
+                ok = False
+            return time.perf_counter() - started, ok
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as pool:
+            outcomes = list(pool.map(send, range(options["requests"])))
+        return outcomes, time.perf_counter() - started
+
+    def report(self, label, measurements):
+        outcomes, elapsed = measurements
+        latencies = sorted(latency for latency, _ in outcomes) or [0]
+        errors = sum(1 for _, ok in outcomes if not ok)
+        percentiles = (
+            statistics.quantiles(latencies, n=100)
+            if len(latencies) > 1
+            else latencies * 99
+        )
+        self.stdout.write(
+            f"{label}{len(outcomes)} requests in {elapsed:.2f}s "
+            f"({len(outcomes) / elapsed:.0f} req/s), "
+            f"p50 {percentiles[49] * 1000:.0f}ms, "
+            f"p95 {percentiles[94] * 1000:.0f}ms, "
+            f"p99 {percentiles[98] * 1000:.0f}ms, "
+            f"{errors} errors"
+        )
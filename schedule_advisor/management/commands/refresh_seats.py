@@ -0,0 +1,63 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from schedule_advisor.seats import DEFAULT_MAX_AGE, refresh_batch, stale_batches
+
+
+class Command(BaseCommand):
+    help = (
+        "Refreshes seat availability from SIS for sections in a schedule or in a "
+        "recently searched subject, stalest first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--max-age",
+            type=int,
+            default=int(DEFAULT_MAX_AGE.total_seconds()),
+            help="Skip sections refreshed within this many seconds",
+        )
+        parser.add_argument(
+            "--batches",
+            type=int,
+            default=None,
+            help="Poll at most this many subjects per round (default: all stale ones)",
+        )
+        parser.add_argument(
+            "--every",
+            type=int,
+            default=None,
+            help="Keep running, starting a new round this many seconds apart",
+        )
+
+    def handle(self, *args, **options):
+        max_age = timedelta(seconds=options["max_age"])
+        while True:
+            started = time.perf_counter()
+            self.refresh(max_age, options["batches"])
+            if options["every"] is None:
+                return
+            time.sleep(max(0.0, options["every"] - (time.perf_counter() - started)))
+
+    def refresh(self, max_age, limit):
+        started = time.perf_counter()
+        batches = stale_batches(max_age)[:limit]
+        read = changed = 0
+        for semester, subject, catalog_number in batches:
+            label = " ".join(filter(None, (semester, subject, catalog_number)))
+            try:
+                batch_read, batch_changed = refresh_batch(
+                    semester, subject, catalog_number
+                )
+            except Exception as e:
+                # the next round retries it, as it is still the stalest
+                self.stderr.write(f"{label}: failed ({e!r})")
+                continue
+            read += batch_read
+            changed += batch_changed
+            self.stdout.write(f"{label}: {batch_changed}/{batch_read} changed")
+        self.stdout.write(
+            f"{len(batches)} batches, {changed}/{read} sections changed "
+            f"in {time.perf_counter() - started:.2f}s"
+        )
@@ -0,0 +1,42 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = (
+        "Copies the default SQLite database into the local replica databases, "
+        "standing in for replication when trying out DATABASE_REPLICAS locally."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--every",
+            type=int,
+            default=None,
+            help="Keep running, copying this many seconds apart (simulates lag)",
+        )
+
+    def handle(self, *args, **options):
+        aliases = settings.DATABASE_REPLICAS or ["replica"]
+        for alias in [DEFAULT_DB_ALIAS, *aliases]:
+            if alias not in connections or connections[alias].vendor != "sqlite":
+                raise CommandError(f"{alias} is not a SQLite database")
+        while True:
+            started = time.perf_counter()
+            source = connections[DEFAULT_DB_ALIAS]
+            source.ensure_connection()
+            for alias in aliases:
+                target = connections[alias]
+                target.ensure_connection()
+                # Retrieved from https://docs.python.org/3/library/sqlite3.html#sqlite3.Connection.backup
+                source.connection.backup(target.connection)
+            self.stdout.write(
+                f"copied to {', '.join(aliases)} "
+                f"in {time.perf_counter() - started:.2f}s"
+            )
+            if options["every"] is None:
+                return
+            time.sleep(options["every"])
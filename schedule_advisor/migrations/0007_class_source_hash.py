@@ -0,0 +1,18 @@
+# Generated by Django 4.1.7 on 2026-10-18 13:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("schedule_advisor", "0006_schedule_approved_schedule_visible"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="class",
+            name="source_hash",
+            field=models.CharField(default="", max_length=64),
+        ),
+    ]
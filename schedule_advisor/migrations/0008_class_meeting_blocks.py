@@ -0,0 +1,63 @@
+# Generated by Django 4.1.7 on 2026-10-18 13:41
+
+from django.db import migrations, models
+
+# Copied from schedule_advisor.models as of this migration, so later changes to
+# the model helpers don't change what it does
+DAY_ABBREVIATIONS = ["Su", "Mo", "Tu", "We", "Th", "Fr", "Sa"]
+
+# Rows updated per bulk_update while iterating over the table
+BATCH_SIZE = 1000
+
+
+def sis_time_to_minutes(sis_time: str) -> int:
+    hours, minutes = sis_time.split(".")[:2]
+    return int(hours) * 60 + int(minutes)
+
+
+def meeting_blocks(source_data) -> list:
+    blocks = []
+    for meeting in source_data.get("meetings", []):
+        days = 0
+        for i in range(0, len(meeting["days"]), 2):
+            abbrev = meeting["days"][i : i + 2]
+            if abbrev in DAY_ABBREVIATIONS:
+                days |= 1 << DAY_ABBREVIATIONS.index(abbrev)
+        if days and meeting["start_time"] and meeting["end_time"]:
+            blocks.append(
+                [
+                    days,
+                    sis_time_to_minutes(meeting["start_time"]),
+                    sis_time_to_minutes(meeting["end_time"]),
+                ]
+            )
+        else:
+            blocks.append([0, 0, 0])
+    return blocks
+
+
+def fill_meeting_blocks(apps, schema_editor):
+    Class = apps.get_model("schedule_advisor", "Class")
+    classes = []
+    for cl in Class.objects.only("id", "source_data").iterator(chunk_size=BATCH_SIZE):
+        cl.meeting_blocks = meeting_blocks(cl.source_data)
+        classes.append(cl)
+        if len(classes) == BATCH_SIZE:
+            Class.objects.bulk_update(classes, ["meeting_blocks"])
+            classes = []
+    Class.objects.bulk_update(classes, ["meeting_blocks"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("schedule_advisor", "0007_class_source_hash"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="class",
+            name="meeting_blocks",
+            field=models.JSONField(default=list),
+        ),
+        migrations.RunPython(fill_meeting_blocks, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.1.7 on 2026-10-18 13:11
+
+from django.db import migrations, models
+
+# Rows updated per bulk_update while iterating over the table
+BATCH_SIZE = 1000
+
+
+# Copied from schedule_advisor.models as of this migration, so later changes to
+# the model helpers don't change what it does
+def search_text(source_data) -> str:
+    parts = [
+        source_data.get("descr", ""),
+        source_data.get("topic", ""),
+        *(instructor["name"] for instructor in source_data.get("instructors", [])),
+        source_data.get("crse_attr", ""),
+    ]
+    return " ".join(part for part in parts if part).lower()
+
+
+def fill_search_text(apps, schema_editor):
+    Class = apps.get_model("schedule_advisor", "Class")
+    classes = []
+    for cl in Class.objects.only("id", "source_data").iterator(chunk_size=BATCH_SIZE):
+        cl.search_text = search_text(cl.source_data)
+        classes.append(cl)
+        if len(classes) == BATCH_SIZE:
+            Class.objects.bulk_update(classes, ["search_text"])
+            classes = []
+    Class.objects.bulk_update(classes, ["search_text"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("schedule_advisor", "0008_class_meeting_blocks"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="class",
+            name="search_text",
+            field=models.TextField(default=""),
+        ),
+        migrations.RunPython(fill_search_text, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.1.7 on 2026-10-18 13:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("schedule_advisor", "0009_class_search_text"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="class",
+            index=models.Index(
+                fields=[
+                    "semester",
+                    "subject",
+                    "catalog_number",
+                    "class_section",
+                    "component",
+                ],
+                name="class_search_order_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,120 @@
+# Generated by Django 4.1.7 on 2026-10-18 13:14
+
+from datetime import datetime
+
+from django.db import migrations, models
+
+CARD_FIELDS = [
+    "topic",
+    "instructors",
+    "meeting_descriptions",
+    "enrl_stat",
+    "enrollment_available",
+    "class_capacity",
+    "wait_tot",
+    "wait_cap",
+]
+
+
+# Rows updated per bulk_update while iterating over the table
+BATCH_SIZE = 1000
+
+
+# Copied from schedule_advisor.models as of this migration, so later changes to
+# the model helpers don't change what it does
+def convert_date(input_string: str) -> str:
+    time_input_format = "%H.%M.%S.%f"
+    time_output_format = "%-I:%M:%S %p"
+    return datetime.strptime(input_string.split("-")[0], time_input_format).strftime(
+        time_output_format
+    )
+
+
+def describe_meeting(meeting) -> str:
+    try:
+        formatted_start_time = convert_date(meeting["start_time"])
+        formatted_end_time = convert_date(meeting["end_time"])
+        return f"{meeting['days']} {formatted_start_time} - {formatted_end_time} from {meeting['start_dt']} to {meeting['end_dt']} in {meeting['facility_descr']}"
+    except ValueError:
+        return "To Be Announced"
+
+
+def card_fields(source_data) -> dict:
+    return {
+        "topic": source_data.get("topic") or "",
+        "instructors": [
+            instructor["name"] for instructor in source_data.get("instructors", [])
+        ],
+        "meeting_descriptions": [
+            describe_meeting(meeting) for meeting in source_data.get("meetings", [])
+        ],
+        "enrl_stat": source_data.get("enrl_stat") or "",
+        "enrollment_available": source_data.get("enrollment_available") or 0,
+        "class_capacity": source_data.get("class_capacity") or 0,
+        "wait_tot": source_data.get("wait_tot") or 0,
+        "wait_cap": source_data.get("wait_cap") or 0,
+    }
+
+
+def fill_card_fields(apps, schema_editor):
+    Class = apps.get_model("schedule_advisor", "Class")
+    classes = []
+    for cl in Class.objects.only("id", "source_data").iterator(chunk_size=BATCH_SIZE):
+        fields = card_fields(cl.source_data)
+        for field in CARD_FIELDS:
+            setattr(cl, field, fields[field])
+        classes.append(cl)
+        if len(classes) == BATCH_SIZE:
+            Class.objects.bulk_update(classes, CARD_FIELDS)
+            classes = []
+    Class.objects.bulk_update(classes, CARD_FIELDS)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("schedule_advisor", "0010_class_search_order_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="class",
+            name="class_capacity",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="class",
+            name="enrl_stat",
+            field=models.CharField(default="", max_length=1),
+        ),
+        migrations.AddField(
+            model_name="class",
+            name="enrollment_available",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="class",
+            name="instructors",
+            field=models.JSONField(default=list),
+        ),
+        migrations.AddField(
+            model_name="class",
+            name="meeting_descriptions",
+            field=models.JSONField(default=list),
+        ),
+        migrations.AddField(
+            model_name="class",
+            name="topic",
+            field=models.CharField(default="", max_length=400),
+        ),
+        migrations.AddField(
+            model_name="class",
+            name="wait_cap",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="class",
+            name="wait_tot",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(fill_card_fields, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.1.7 on 2026-10-18 15:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("schedule_advisor", "0011_class_card_fields"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="schedule",
+            name="version",
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
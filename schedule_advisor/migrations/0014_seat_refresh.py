@@ -0,0 +1,37 @@
+# Generated by Django 4.1.7 on 2026-10-18 16:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("schedule_advisor", "0013_catalogversion"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="class",
+            name="enrollment_updated_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name="RecentSearch",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("semester", models.CharField(max_length=10)),
+                ("subject", models.CharField(max_length=10)),
+                ("searched_at", models.DateTimeField()),
+            ],
+            options={
+                "unique_together": {("semester", "subject")},
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.1.7 on 2026-10-18 13:35
+
+from django.db import migrations
+import schedule_advisor.models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("schedule_advisor", "0014_seat_refresh"),
+    ]
+
+    operations = [
+        migrations.AlterModelManagers(
+            name="user",
+            managers=[
+                ("objects", schedule_advisor.models.AppUserManager()),
+            ],
+        ),
+    ]
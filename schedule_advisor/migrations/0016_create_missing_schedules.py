@@ -0,0 +1,21 @@
+from django.db import migrations
+
+
+def create_missing_schedules(apps, schema_editor):
+    # users created before create_schedule was connected
+    User = apps.get_model("schedule_advisor", "User")
+    Schedule = apps.get_model("schedule_advisor", "Schedule")
+    Schedule.objects.bulk_create(
+        Schedule(connected_user=user)
+        for user in User.objects.filter(schedule__isnull=True).only("id")
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("schedule_advisor", "0015_alter_user_managers"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_missing_schedules, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+from django.db import migrations
+
+
+def drop_update_trigger(apps, schema_editor):
+    # fired on every update of a class; ensure_search_index recreates it (for
+    # search_text updates only) after the migrations have run
+    if schema_editor.connection.vendor == "sqlite":
+        schema_editor.execute(
+            "DROP TRIGGER IF EXISTS schedule_advisor_class_search_update"
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("schedule_advisor", "0016_create_missing_schedules"),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_update_trigger, migrations.RunPython.noop),
+    ]
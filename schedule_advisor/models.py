@@ -1,105 +1,312 @@
-from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import AbstractUser, UserManager
 from django.db import models
-from datetime import time
+from django.db.models import Count, F
+from datetime import datetime
+import hashlib
+import json
 from annoying.fields import AutoOneToOneField
 
+from schedule_advisor.conflicts import ConflictIndex
+
+
+class UserQuerySet(models.QuerySet):
+    def with_schedule_summary(self):
+        # schedule status and size as columns of the same query, so listing
+        # students never loads (or, through AutoOneToOneField, creates) a Schedule
+        return self.annotate(
+            schedule_visible=F("schedule__visible"),
+            schedule_approved=F("schedule__approved"),
+            class_count=Count("schedule__classes"),
+        )
+
+
+class AppUserManager(UserManager.from_queryset(UserQuerySet)):
+    pass
+
 
 class User(AbstractUser):
-    # TODO: figure out how to make a Schedule for a User by default
+    # every user gets a Schedule when created (see create_schedule)
     is_advisor = models.BooleanField(default=False)
     advisor = models.ForeignKey("self", on_delete=models.CASCADE, null=True, blank=True)
 
+    objects = AppUserManager()
+
 
 def display_name(user: User):
     return f"{user.first_name} {user.last_name} ({user.username})"
 
 
+def hash_source_data(source_data) -> str:
+    # key order in SIS responses is not guaranteed, so hash a canonical encoding
+    encoded = json.dumps(source_data, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+DAY_ABBREVIATIONS = ["Su", "Mo", "Tu", "We", "Th", "Fr", "Sa"]
+
+
+def sis_time_to_minutes(sis_time: str) -> int:
+    # e.g. "16.00.00.000000-05:00" -> 960
+    hours, minutes = sis_time.split(".")[:2]
+    return int(hours) * 60 + int(minutes)
+
+
+def meeting_blocks(source_data) -> list:
+    # Each meeting as [days, start, end]: days is a bitmask with bit 0 for Sunday
+    # through bit 6 for Saturday, start and end are minutes after midnight.
+    # Meetings without days or times (e.g. "-") are kept as [0, 0, 0].
+    blocks = []
+    for meeting in source_data.get("meetings", []):
+        days = 0
+        for i in range(0, len(meeting["days"]), 2):
+            abbrev = meeting["days"][i : i + 2]
+            if abbrev in DAY_ABBREVIATIONS:
+                days |= 1 << DAY_ABBREVIATIONS.index(abbrev)
+        if days and meeting["start_time"] and meeting["end_time"]:
+            blocks.append(
+                [
+                    days,
+                    sis_time_to_minutes(meeting["start_time"]),
+                    sis_time_to_minutes(meeting["end_time"]),
+                ]
+            )
+        else:
+            blocks.append([0, 0, 0])
+    return blocks
+
+
+def search_text(source_data) -> str:
+    # lowercased text matched by keyword searches
+    parts = [
+        source_data.get("descr", ""),
+        source_data.get("topic", ""),
+        *(instructor["name"] for instructor in source_data.get("instructors", [])),
+        source_data.get("crse_attr", ""),
+    ]
+    return " ".join(part for part in parts if part).lower()
+
+
+def convert_date(input_string: str) -> str:
+    time_input_format = "%H.%M.%S.%f"
+    time_output_format = "%-I:%M:%S %p"
+    return datetime.strptime(input_string.split("-")[0], time_input_format).strftime(
+        time_output_format
+    )
+
+
+def describe_meeting(meeting) -> str:
+    try:
+        formatted_start_time = convert_date(meeting["start_time"])
+        formatted_end_time = convert_date(meeting["end_time"])
+        return f"{meeting['days']} {formatted_start_time} - {formatted_end_time} from {meeting['start_dt']} to {meeting['end_dt']} in {meeting['facility_descr']}"
+    except ValueError:
+        return "To Be Announced"
+
+
+def derived_fields(source_data) -> dict:
+    # Columns computed from the raw SIS record, so that class cards, searches and
+    # conflict checks never need to load source_data itself.
+    return {
+        "source_hash": hash_source_data(source_data),
+        "meeting_blocks": meeting_blocks(source_data),
+        "search_text": search_text(source_data),
+        "topic": source_data.get("topic") or "",
+        "instructors": [
+            instructor["name"] for instructor in source_data.get("instructors", [])
+        ],
+        "meeting_descriptions": [
+            describe_meeting(meeting) for meeting in source_data.get("meetings", [])
+        ],
+        **enrollment_fields(source_data),
+    }
+
+
+def enrollment_fields(source_data) -> dict:
+    return {
+        "enrl_stat": source_data.get("enrl_stat") or "",
+        "enrollment_available": source_data.get("enrollment_available") or 0,
+        "class_capacity": source_data.get("class_capacity") or 0,
+        "wait_tot": source_data.get("wait_tot") or 0,
+        "wait_cap": source_data.get("wait_cap") or 0,
+    }
+
+
+DERIVED_FIELDS = list(derived_fields({}))
+
+# Columns (and SIS keys) refreshed by seats.py between full ingests
+ENROLLMENT_FIELDS = list(enrollment_fields({}))
+
+# Columns that list views never render
+CARD_DEFERRED_FIELDS = ["source_data", "search_text"]
+
+
+class ClassQuerySet(models.QuerySet):
+    def for_cards(self):
+        return self.defer(*CARD_DEFERRED_FIELDS)
+
+
 class Class(models.Model):
     class Meta:
         unique_together = ("semester", "class_number")
+        indexes = [
+            # matches the filters and ORDER BY of ClassSearchForm.get_results_from_database
+            models.Index(
+                fields=[
+                    "semester",
+                    "subject",
+                    "catalog_number",
+                    "class_section",
+                    "component",
+                ],
+                name="class_search_order_idx",
+            ),
+        ]
 
     name = models.CharField(max_length=400)
     class_number = models.IntegerField(default=0)
     semester = models.CharField(max_length=10, default="")
     source_data = models.JSONField(default=dict)
+    source_hash = models.CharField(max_length=64, default="")
+    meeting_blocks = models.JSONField(default=list)
+    search_text = models.TextField(default="")
+    topic = models.CharField(max_length=400, default="")
+    instructors = models.JSONField(default=list)
+    meeting_descriptions = models.JSONField(default=list)
+    enrl_stat = models.CharField(max_length=1, default="")
+    enrollment_available = models.IntegerField(default=0)
+    class_capacity = models.IntegerField(default=0)
+    wait_tot = models.IntegerField(default=0)
+    wait_cap = models.IntegerField(default=0)
+    # last time the enrollment columns were read from SIS
+    enrollment_updated_at = models.DateTimeField(null=True, blank=True)
     subject = models.CharField(max_length=10, default="")
     catalog_number = models.CharField(max_length=10, default="0000")
     class_section = models.CharField(max_length=10, default="001")
     component = models.CharField(max_length=10, default="LEC")
     units = models.CharField(max_length=10, default="3")
 
+    objects = ClassQuerySet.as_manager()
+
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_sis(cls, result):
+        return cls(
+            semester=result["strm"],
+            class_number=result["class_nbr"],
+            subject=result["subject"],
+            catalog_number=result["catalog_nbr"],
+            class_section=result["class_section"],
+            component=result["component"],
+            units=result["units"],
+            source_data=result,
+            name=result["descr"],
+            **derived_fields(result),
+        )
+
+    def save(self, *args, **kwargs):
+        if "source_data" not in self.get_deferred_fields():
+            for field, value in derived_fields(self.source_data).items():
+                setattr(self, field, value)
+        super().save(*args, **kwargs)
+
     def meeting_days(self):
+        # e.g. {"Tu": (960, 1035), "Th": (960, 1035)}, or {"-": (0, 0)} for TBA meetings
         days = {}
-        for meeting in self.source_data["meetings"]:
-            for i in range(0, len(meeting["days"]), 2):
-                days[meeting["days"][i : i + 2]] = (
-                    meeting["start_time"],
-                    meeting["end_time"],
-                )
+        for day_mask, start, end in self.meeting_blocks:
+            if not day_mask:
+                days["-"] = (start, end)
+            for i, abbrev in enumerate(DAY_ABBREVIATIONS):
+                if day_mask & (1 << i):
+                    days[abbrev] = (start, end)
         return days
 
 
 def classes_overlap(class1, class2):
-    meeting_days_1 = class1.meeting_days()
-    meeting_days_2 = class2.meeting_days()
-    for day in set(meeting_days_1.keys()).intersection(set(meeting_days_2.keys())):
-        start_1_t = tuple(int(i) for i in meeting_days_1[day][0].split(".")[:3])
-        end_1_t = tuple(int(i) for i in meeting_days_1[day][1].split(".")[:3])
-        start_2_t = tuple(int(i) for i in meeting_days_2[day][0].split(".")[:3])
-        end_2_t = tuple(int(i) for i in meeting_days_2[day][1].split(".")[:3])
-        start_1 = time(*start_1_t)
-        end_1 = time(*end_1_t)
-        start_2 = time(*start_2_t)
-        end_2 = time(*end_2_t)
-        if start_1 <= start_2 < end_1:
-            return True
-        elif start_2 <= start_1 < end_2:
-            return True
+    for days_1, start_1, end_1 in class1.meeting_blocks:
+        for days_2, start_2, end_2 in class2.meeting_blocks:
+            if days_1 & days_2 and start_1 < end_2 and start_2 < end_1:
+                return True
     return False
 
 
+class CatalogVersion(models.Model):
+    # bumped by every ingest that changes a term; keys cached catalog data and ETags
+    semester = models.CharField(max_length=10, unique=True)
+    version = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.semester} v{self.version}"
+
+
+class RecentSearch(models.Model):
+    # subjects students are looking at, so seats.py knows what to keep fresh
+    class Meta:
+        unique_together = ("semester", "subject")
+
+    semester = models.CharField(max_length=10)
+    subject = models.CharField(max_length=10)
+    searched_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.semester} {self.subject}"
+
+
 class Schedule(models.Model):
     connected_user = AutoOneToOneField(User, on_delete=models.CASCADE)
     classes = models.ManyToManyField(Class)
     visible = models.BooleanField(default=False, null=False, blank=False)
     approved = models.BooleanField(default=None, null=True, blank=False)
+    # bumped whenever classes change, keys the cached layout in layout.py
+    version = models.PositiveIntegerField(default=0)
+
+    def conflict_index(self):
+        # built once per Schedule instance, i.e. once per request for user.schedule
+        if getattr(self, "_conflict_index", None) is None:
+            self._conflict_index = ConflictIndex(self.classes.for_cards())
+        return self._conflict_index
 
     def class_can_be_added(self, new_class):
-        schedule = self.classes.all()
-        if new_class in schedule:  # class is already in schedule
-            return False
-        if new_class.source_data["enrl_stat"] == "C":  # closed
-            return False
-        for each_class in schedule:
-            if each_class.semester != new_class.semester:
-                return False
-            if classes_overlap(
-                each_class, new_class
-            ):  # class conflicts with one already in schedule
-                return False
-            if (
-                each_class.subject == new_class.subject
-                and each_class.catalog_number == new_class.catalog_number
-                and each_class.component == new_class.component
-            ):  # same course, different section (e.g. two lectures for the same class)
-                return False
-        return True
+        return self.conflict_index().can_add(new_class)
+
+    def classes_can_be_added(self, classes):
+        return self.conflict_index().check_many(classes)
+
+    def annotate_classes(self, classes):
+        # sets can_be_added and in_schedule on each class for the class cards
+        index = self.conflict_index()
+        for cl in classes:
+            cl.can_be_added = index.can_add(cl)
+            cl.in_schedule = cl.id in index.class_ids
 
     def add_class(self, new_class):
         if self.class_can_be_added(new_class):
             self.classes.add(new_class)
+            self.classes_changed()
         else:
             raise Exception("Course cannot be added.")
 
     def remove_class(self, old_class):
         if old_class in self.classes.all():
             self.classes.remove(old_class)
+            self.classes_changed()
         else:
             raise Exception("Course is not in schedule.")
 
+    def classes_changed(self):
+        self._conflict_index = None
+        Schedule.objects.filter(pk=self.pk).update(version=F("version") + 1)
+        self.version += 1
+
     def reset_advisor(self):
         self.approved = None
-        self.save()
+        self.save(update_fields=["visible", "approved"])
+
+
+def create_schedule(sender, instance, created, raw=False, **kwargs):
+    # Connected to User's post_save, so request paths can read user.schedule
+    # without AutoOneToOneField ever having to insert one
+    if created and not raw:
+        Schedule.objects.get_or_create(connected_user=instance)
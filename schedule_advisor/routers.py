@@ -0,0 +1,125 @@
+import random
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+# Models whose reads may be served by a replica: the catalog and schedules.
+# Users, sessions and everything else are always read from the primary.
+REPLICATED_MODELS = {
+    "schedule_advisor.Class",
+    "schedule_advisor.CatalogVersion",
+    "schedule_advisor.Schedule",
+    "schedule_advisor.Schedule_classes",
+}
+
+# Writes to these are a user's own changes, which they expect to see right away
+PINNING_MODELS = {
+    "schedule_advisor.User",
+    "schedule_advisor.Schedule",
+    "schedule_advisor.Schedule_classes",
+}
+
+# Cookie holding the time until which a user's reads go to the primary
+PIN_COOKIE = "primary_until"
+
+# Requests with any other method may write, so they read from the primary
+# throughout rather than only after their first write
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class RoutingState:
+    def __init__(self, pinned):
+        self.pinned = pinned
+        self.wrote = False
+
+
+# Set by ReplicaPinMiddleware for the request being handled. Outside of requests
+# (management commands, the seat refresh worker, migrations) it is None and
+# every query goes to the primary, so ingest never reads its own data back from
+# a lagging replica.
+current_state = ContextVar("current_state", default=None)
+
+
+class ReplicaRouter:
+    """Sends reads of REPLICATED_MODELS made while handling a GET, HEAD or
+    OPTIONS request to one of the DATABASE_REPLICAS, and every write to the
+    primary. After a user writes their own data, their reads stay on the
+    primary for REPLICA_PIN_SECONDS."""
+
+    def db_for_read(self, model, **hints):
+        state = current_state.get()
+        if (
+            state is None
+            or state.pinned
+            or not settings.DATABASE_REPLICAS
+            or model._meta.label not in REPLICATED_MODELS
+        ):
+            return DEFAULT_DB_ALIAS
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        state = current_state.get()
+        if state is not None and model._meta.label in PINNING_MODELS:
+            # the rest of this request reads its own writes, and so do the next ones
+            state.pinned = state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # every alias is a copy of the same database, e.g. a row read from a
+        # replica may be assigned to one that is about to be saved to the primary
+        return True
+
+
+def pinned(request) -> bool:
+    try:
+        return float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+class ReplicaPinMiddleware:
+    """Lets ReplicaRouter route the request's reads, and sets the PIN_COOKIE on
+    responses to requests that wrote the user's own data."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = RoutingState(pinned(request) or request.method not in SAFE_METHODS)
+        token = current_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_state.reset(token)
+        return self.pin(state, response)
+
+    async def __acall__(self, request):
+        state = RoutingState(pinned(request) or request.method not in SAFE_METHODS)
+        token = current_state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_state.reset(token)
+        return self.pin(state, response)
+
+    @staticmethod
+    def pin(state, response):
+        if state.wrote and settings.DATABASE_REPLICAS:
+            response.set_cookie(
+                PIN_COOKIE,
+                str(time.time() + settings.REPLICA_PIN_SECONDS),
+                max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
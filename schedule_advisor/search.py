@@ -0,0 +1,240 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+# SQLite FTS5 index over Class.search_text, kept in sync by triggers
+FTS_TABLE = "schedule_advisor_class_search"
+
+# FTS5's trigram tokenizer (and pg_trgm) can only match keywords this long
+MIN_INDEXED_KEYWORD = 3
+
+SQLITE_SEARCH_INDEX = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        search_text,
+        content='schedule_advisor_class',
+        content_rowid='id',
+        tokenize='trigram'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert
+        AFTER INSERT ON schedule_advisor_class BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, search_text) VALUES (new.id, new.search_text);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete
+        AFTER DELETE ON schedule_advisor_class BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_text)
+        VALUES ('delete', old.id, old.search_text);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update
+        AFTER UPDATE OF search_text ON schedule_advisor_class BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_text)
+        VALUES ('delete', old.id, old.search_text);
+        INSERT INTO {FTS_TABLE}(rowid, search_text) VALUES (new.id, new.search_text);
+    END""",
+]
+
+# SQLite FTS5 index over the names of users, for the advisee search
+USER_FTS_TABLE = "schedule_advisor_user_search"
+
+SQLITE_USER_SEARCH_INDEX = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {USER_FTS_TABLE} USING fts5(
+        first_name, last_name, username,
+        content='schedule_advisor_user',
+        content_rowid='id',
+        tokenize='trigram'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {USER_FTS_TABLE}_insert
+        AFTER INSERT ON schedule_advisor_user BEGIN
+        INSERT INTO {USER_FTS_TABLE}(rowid, first_name, last_name, username)
+        VALUES (new.id, new.first_name, new.last_name, new.username);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {USER_FTS_TABLE}_delete
+        AFTER DELETE ON schedule_advisor_user BEGIN
+        INSERT INTO {USER_FTS_TABLE}({USER_FTS_TABLE}, rowid, first_name, last_name, username)
+        VALUES ('delete', old.id, old.first_name, old.last_name, old.username);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {USER_FTS_TABLE}_update
+        AFTER UPDATE OF first_name, last_name, username ON schedule_advisor_user BEGIN
+        INSERT INTO {USER_FTS_TABLE}({USER_FTS_TABLE}, rowid, first_name, last_name, username)
+        VALUES ('delete', old.id, old.first_name, old.last_name, old.username);
+        INSERT INTO {USER_FTS_TABLE}(rowid, first_name, last_name, username)
+        VALUES (new.id, new.first_name, new.last_name, new.username);
+    END""",
+]
+
+POSTGRES_SEARCH_INDEX = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    """CREATE INDEX IF NOT EXISTS schedule_advisor_class_search_trgm
+        ON schedule_advisor_class USING gin (search_text gin_trgm_ops)""",
+    # matches the UPPER("first_name"::text) LIKE UPPER(...) that icontains compiles to
+    """CREATE INDEX IF NOT EXISTS schedule_advisor_user_name_trgm
+        ON schedule_advisor_user USING gin (
+            (UPPER(first_name::text)) gin_trgm_ops,
+            (UPPER(last_name::text)) gin_trgm_ops,
+            (UPPER(username::text)) gin_trgm_ops
+        )""",
+]
+
+SQLITE_SEARCH_INDEXES = [
+    (FTS_TABLE, SQLITE_SEARCH_INDEX),
+    (USER_FTS_TABLE, SQLITE_USER_SEARCH_INDEX),
+]
+
+
+# Table names of each database alias, looked up once rather than on every
+# search. Only ensure_search_index creates the FTS tables, and it resets them.
+table_names = {}
+
+
+def ensure_search_index(using=DEFAULT_DB_ALIAS, **kwargs):
+    """Creates the keyword and name search indexes if they are missing.
+    Connected to post_migrate, because SQLite drops the triggers whenever a
+    migration rebuilds the class or user table."""
+    try:
+        create_search_index(connections[using])
+    finally:
+        table_names.pop(using, None)
+
+
+def create_search_index(connection):
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            for statement in POSTGRES_SEARCH_INDEX:
+                cursor.execute(statement)
+        elif connection.vendor == "sqlite":
+            for table, statements in SQLITE_SEARCH_INDEXES:
+                cursor.execute(
+                    "SELECT count(*) FROM sqlite_master WHERE type = 'trigger' "
+                    "AND name LIKE %s",
+                    [f"{table}_%"],
+                )
+                if cursor.fetchone()[0] == len(statements) - 1:
+                    continue
+                try:
+                    for statement in statements:
+                        cursor.execute(statement)
+                except connection.Database.OperationalError:
+                    return  # SQLite built without FTS5 or the trigram tokenizer
+                cursor.execute(f"INSERT INTO {table}({table}) VALUES ('rebuild')")
+
+
+def has_fts_table(connection, table=FTS_TABLE):
+    if connection.alias not in table_names:
+        table_names[connection.alias] = set(connection.introspection.table_names())
+    return table in table_names[connection.alias]
+
+
+def fts_query(words) -> str:
+    # e.g. '"dance" "intro"', matched as substrings by the trigram tokenizer
+    return " ".join('"' + word.replace('"', '""') + '"' for word in words)
+
+
+def filter_keywords(classes, keywords):
+    """Narrows a Class queryset to classes whose name, topic, instructors or
+    course attributes contain every keyword (case-insensitive)."""
+    connection = connections[classes.db]
+    keywords = [keyword.lower() for keyword in keywords]
+    if connection.vendor == "sqlite" and has_fts_table(connection):
+        indexed = [k for k in keywords if len(k) >= MIN_INDEXED_KEYWORD]
+        if indexed:
+            classes = classes.filter(
+                id__in=RawSQL(
+                    f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s",
+                    [fts_query(indexed)],
+                )
+            )
+            keywords = [k for k in keywords if len(k) < MIN_INDEXED_KEYWORD]
+    for keyword in keywords:
+        # uses the trigram index on PostgreSQL
+        classes = classes.filter(search_text__contains=keyword)
+    return classes
+
+
+def filter_names(users, query):
+    """Narrows a User queryset to users whose first name, last name or username
+    contains each word of ``query`` (case-insensitive), using the name index."""
+    connection = connections[users.db]
+    words = query.lower().split()
+    if connection.vendor == "sqlite" and has_fts_table(connection, USER_FTS_TABLE):
+        indexed = [word for word in words if len(word) >= MIN_INDEXED_KEYWORD]
+        if indexed:
+            users = users.filter(
+                id__in=RawSQL(
+                    f"SELECT rowid FROM {USER_FTS_TABLE} "
+                    f"WHERE {USER_FTS_TABLE} MATCH %s",
+                    [fts_query(indexed)],
+                )
+            )
+            words = [word for word in words if len(word) < MIN_INDEXED_KEYWORD]
+    for word in words:
+        # uses the trigram index on PostgreSQL
+        users = users.filter(
+            Q(first_name__icontains=word)
+            | Q(last_name__icontains=word)
+            | Q(username__icontains=word)
+        )
+    return users
+
+
+# Students listed by the advisor dashboard's search and by the typeahead API
+STUDENT_RESULTS = 50
+TYPEAHEAD_RESULTS = 10
+
+
+# Order of search results; id breaks ties so every row has a unique position
+RESULT_ORDER = ("subject", "catalog_number", "class_section", "component", "id")
+
+RESULTS_PER_PAGE = 50
+
+
+def encode_cursor(cl) -> str:
+    values = [getattr(cl, field) for field in RESULT_ORDER]
+    return urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> list:
+    values = json.loads(urlsafe_b64decode(cursor.encode()))
+    if not isinstance(values, list) or len(values) != len(RESULT_ORDER):
+        raise ValueError("Malformed cursor")
+    return values
+
+
+def after_cursor(values) -> Q:
+    # (subject, catalog_number, ...) > (values[0], values[1], ...), one column at a time
+    condition = Q()
+    equal = {}
+    for field, value in zip(RESULT_ORDER, values):
+        condition |= Q(**equal, **{f"{field}__gt": value})
+        equal[field] = value
+    return condition
+
+
+def page_query(classes, cursor, per_page):
+    # one row more than the page, to tell whether another page follows
+    if cursor:
+        try:
+            classes = classes.filter(after_cursor(decode_cursor(cursor)))
+        except (ValueError, TypeError):
+            pass  # start over from the first page
+    return classes[: per_page + 1]
+
+
+def split_page(page, per_page):
+    if len(page) > per_page:
+        return page[:per_page], encode_cursor(page[per_page - 1])
+    return page, None
+
+
+def paginate(classes, cursor=None, per_page=None):
+    """Returns the page of an ordered Class queryset that follows ``cursor``,
+    and the cursor of the page after it (None on the last page)."""
+    per_page = per_page or RESULTS_PER_PAGE
+    return split_page(list(page_query(classes, cursor, per_page)), per_page)
+
+
+async def apaginate(classes, cursor=None, per_page=None):
+    per_page = per_page or RESULTS_PER_PAGE
+    page = [cl async for cl in page_query(classes, cursor, per_page)]
+    return split_page(page, per_page)
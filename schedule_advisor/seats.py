@@ -0,0 +1,123 @@
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from schedule_advisor.cache import invalidate_term
+from schedule_advisor.models import (
+    ENROLLMENT_FIELDS,
+    Class,
+    RecentSearch,
+    enrollment_fields,
+    hash_source_data,
+)
+from schedule_advisor.sis import get_client
+
+# Subjects searched within this window keep having their seats refreshed
+RECENT_SEARCH_WINDOW = timedelta(hours=1)
+
+# Each process records a searched subject at most once per this many seconds
+RECORD_INTERVAL = 60
+
+# Sections refreshed more recently than this are skipped
+DEFAULT_MAX_AGE = timedelta(minutes=5)
+
+# Sorts sections that were never refreshed before all others
+NEVER = datetime.min.replace(tzinfo=dt_timezone.utc)
+
+
+async def arecord_searches(semester, subjects):
+    for subject in subjects:
+        if await cache.aadd(f"searched:{semester}:{subject}", True, RECORD_INTERVAL):
+            await RecentSearch.objects.aupdate_or_create(
+                semester=semester,
+                subject=subject,
+                defaults={"searched_at": timezone.now()},
+            )
+
+
+def stale_batches(max_age=DEFAULT_MAX_AGE, now=None) -> list:
+    """(semester, subject, catalog_number) batches to poll, stalest first.
+
+    Covers sections in any schedule and every section of a recently searched
+    subject. catalog_number narrows the SIS query when the only stale
+    sections of a subject belong to one scheduled course, and is None when
+    the whole subject is polled."""
+    now = now or timezone.now()
+    searched = set(
+        RecentSearch.objects.filter(
+            searched_at__gte=now - RECENT_SEARCH_WINDOW
+        ).values_list("semester", "subject")
+    )
+    wanted = Q(schedule__isnull=False)
+    for semester, subject in searched:
+        wanted |= Q(semester=semester, subject=subject)
+    stale = Q(enrollment_updated_at__isnull=True) | Q(
+        enrollment_updated_at__lt=now - max_age
+    )
+    rows = (
+        Class.objects.filter(wanted)
+        .filter(stale)
+        .values_list("semester", "subject", "catalog_number", "enrollment_updated_at")
+        .distinct()
+    )
+    catalogs = defaultdict(set)
+    oldest = {}
+    for semester, subject, catalog_number, updated_at in rows:
+        key = (semester, subject)
+        catalogs[key].add(catalog_number)
+        oldest[key] = min(oldest.get(key, updated_at or NEVER), updated_at or NEVER)
+    batches = []
+    for key in sorted(oldest, key=oldest.get):
+        catalog_number = None
+        if key not in searched and len(catalogs[key]) == 1:
+            catalog_number = next(iter(catalogs[key]))
+        batches.append((*key, catalog_number))
+    return batches
+
+
+def refresh_batch(semester, subject, catalog_number=None):
+    """Reads a subject (or one course) from SIS and writes only the enrollment
+    of sections whose seats changed. Returns (sections read, sections changed).
+
+    source_data and source_hash are patched along with the columns, so cached
+    class cards and the next full ingest see the new numbers too."""
+    params = {"term": semester, "subject": subject}
+    if catalog_number:
+        params["catalog_nbr"] = catalog_number
+    fresh = {}
+    for page_results in get_client().pages(**params):
+        for result in page_results:
+            fresh[result["class_nbr"]] = result
+    classes = Class.objects.filter(semester=semester, class_number__in=fresh).only(
+        "id", "class_number", "source_data", *ENROLLMENT_FIELDS
+    )
+    now = timezone.now()
+    changed = []
+    for cl in classes:
+        result = fresh[cl.class_number]
+        values = enrollment_fields(result)
+        if all(getattr(cl, field) == value for field, value in values.items()):
+            continue
+        for field, value in values.items():
+            setattr(cl, field, value)
+            cl.source_data[field] = result.get(field)
+        cl.source_hash = hash_source_data(cl.source_data)
+        cl.enrollment_updated_at = now
+        changed.append(cl)
+    with transaction.atomic():
+        if changed:
+            Class.objects.bulk_update(
+                changed,
+                ENROLLMENT_FIELDS
+                + ["source_data", "source_hash", "enrollment_updated_at"],
+            )
+        Class.objects.filter(semester=semester, class_number__in=fresh).exclude(
+            pk__in=[cl.pk for cl in changed]
+        ).update(enrollment_updated_at=now)
+    if changed:
+        invalidate_term(semester)
+    return len(fresh), len(changed)
@@ -9,6 +9,7 @@ https://docs.djangoproject.com/en/4.1/topics/settings/
 For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.1/ref/settings/
 """
+
 import dj_database_url
 import os
 from pathlib import Path
@@ -58,8 +59,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "schedule_advisor.instrumentation.RequestMetricsMiddleware",
+    "schedule_advisor.routers.ReplicaPinMiddleware",
     "django.middleware.security.SecurityMiddleware",
-    "whitenoise.middleware.WhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -74,7 +76,7 @@ ROOT_URLCONF = "schedule_advisor.urls"
 
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        "BACKEND": "schedule_advisor.instrumentation.InstrumentedDjangoTemplates",
         "DIRS": [BASE_DIR / "templates"],
         "APP_DIRS": True,
         "OPTIONS": {
@@ -94,7 +96,9 @@ WSGI_APPLICATION = "schedule_advisor.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
-MAX_CONN_AGE = 600
+# asgi.py sets this to 0: async requests run their queries on per-request
+# threads, so a persistent connection would never be reused
+MAX_CONN_AGE = int(os.environ.get("CONN_MAX_AGE", 600))
 
 dbconf = {}
 
@@ -102,6 +106,11 @@ if IS_HEROKU:
     dbconf = {
         "default": dj_database_url.config(conn_max_age=MAX_CONN_AGE, ssl_require=True)
     }
+    # e.g. "postgres://...follower1 postgres://...follower2"
+    for i, url in enumerate(os.environ.get("REPLICA_DATABASE_URLS", "").split()):
+        dbconf[f"replica{i + 1}"] = dj_database_url.parse(
+            url, conn_max_age=MAX_CONN_AGE, ssl_require=True
+        )
     SECURE_SSL_REDIRECT = True
     SECURE_HSTS_SECONDS = 31536000
     SECURE_HSTS_INCLUDE_SUBDOMAINS = True
@@ -111,11 +120,89 @@ else:
         "default": {
             "ENGINE": "django.db.backends.sqlite3",
             "NAME": BASE_DIR / "db.sqlite3",
-        }
+        },
+        # a second SQLite file standing in for a read replica; only used when
+        # DATABASE_REPLICAS=replica, and filled by `manage.py sync_replica`
+        "replica": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": BASE_DIR / "db.replica.sqlite3",
+        },
     }
 
 DATABASES = dbconf
 
+# Aliases that catalog and schedule reads are spread across (see
+# schedule_advisor/routers.py): every replica on Heroku, none by default locally
+DATABASE_REPLICAS = os.environ.get(
+    "DATABASE_REPLICAS",
+    " ".join(alias for alias in DATABASES if alias != "default") if IS_HEROKU else "",
+).split()
+DATABASE_ROUTERS = ["schedule_advisor.routers.ReplicaRouter"]
+# Seconds a user's reads stay on the primary after they change their own data
+REPLICA_PIN_SECONDS = int(os.environ.get("REPLICA_PIN_SECONDS", 5))
+
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+
+# Seconds before a cached entry expires; entries are also dropped when an ingest
+# bumps their term's version (see schedule_advisor/cache.py)
+CACHE_TIMEOUT = int(os.environ.get("CACHE_TIMEOUT", 60 * 60))
+# Entries kept by the local-memory and file backends before the oldest are culled
+CACHE_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", 10000))
+
+if "REDIS_URL" in os.environ:
+    # shared by every dyno and by the ingest command; set the server's
+    # maxmemory-policy to allkeys-lru so it evicts like the local backends
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ["REDIS_URL"],
+            "TIMEOUT": CACHE_TIMEOUT,
+        }
+    }
+elif "CACHE_DIR" in os.environ:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": os.environ["CACHE_DIR"],
+            "TIMEOUT": CACHE_TIMEOUT,
+            "OPTIONS": {"MAX_ENTRIES": CACHE_MAX_ENTRIES},
+        }
+    }
+else:
+    # per process, so an ingest run from manage.py only reaches it through CACHE_TIMEOUT
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "TIMEOUT": CACHE_TIMEOUT,
+            "OPTIONS": {"MAX_ENTRIES": CACHE_MAX_ENTRIES},
+        }
+    }
+
+# Request metrics (see schedule_advisor/instrumentation.py)
+
+# Fraction of requests timed and logged; the rest skip the instrumentation
+REQUEST_METRICS_SAMPLE_RATE = float(os.environ.get("REQUEST_METRICS_SAMPLE_RATE", 1.0))
+# Requests slower than this many milliseconds are logged with their duplicated queries
+REQUEST_METRICS_SLOW_MS = int(os.environ.get("REQUEST_METRICS_SLOW_MS", 1000))
+
+# Retrieved from https://docs.djangoproject.com/en/4.1/topics/logging/
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {"console": {"class": "logging.StreamHandler"}},
+    "loggers": {
+        "schedule_advisor.requests": {
+            "handlers": ["console"],
+            # one line per request on Heroku, only slow requests elsewhere
+            "level": os.environ.get(
+                "REQUEST_LOG_LEVEL", "INFO" if IS_HEROKU else "WARNING"
+            ),
+            "propagate": False,
+        },
+    },
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -217,7 +304,14 @@ CSRF_TRUSTED_ORIGINS = [
     "https://accounts.google.com",
 ]
 
-SIS_API_URL = "https://sisuva.admin.virginia.edu/psc/ihprd/UVSS/SA/s/WEBLIB_HCX_CM.H_CLASS_SEARCH.FieldFormula.IScript_ClassSearch?institution=UVA01"
+SIS_API_URL = os.environ.get(
+    "SIS_API_URL",
+    "https://sisuva.admin.virginia.edu/psc/ihprd/UVSS/SA/s/WEBLIB_HCX_CM.H_CLASS_SEARCH.FieldFormula.IScript_ClassSearch?institution=UVA01",
+)
+# Number of SIS pages fetched ahead of the one currently being processed
+SIS_FETCH_WORKERS = int(os.environ.get("SIS_FETCH_WORKERS", 4))
+SIS_RETRIES = 3
+SIS_TIMEOUT = 30
 
 CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
 CRISPY_TEMPLATE_PACK = "bootstrap5"
@@ -0,0 +1,88 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from schedule_advisor.settings import (
+    SIS_API_URL,
+    SIS_FETCH_WORKERS,
+    SIS_RETRIES,
+    SIS_TIMEOUT,
+)
+
+
+class SISClient:
+    """Keep-alive client for the SIS class search API.
+
+    Pages are fetched ahead of time by a small thread pool and handed back in
+    order, so the next few round trips overlap with writing the current page.
+    """
+
+    def __init__(
+        self,
+        base_url=SIS_API_URL,
+        workers=SIS_FETCH_WORKERS,
+        retries=SIS_RETRIES,
+        backoff=0.5,
+        timeout=SIS_TIMEOUT,
+    ):
+        self.base_url = base_url
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.session = requests.Session()
+        # Retrieved from https://urllib3.readthedocs.io/en/stable/reference/urllib3.util.html#urllib3.util.Retry
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=["GET"],
+        )
+        adapter = HTTPAdapter(
+            max_retries=retry, pool_connections=1, pool_maxsize=self.workers
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def get_page(self, page, **params):
+        # params: e.g. {'term': '1238', 'subject': 'KOR', 'catalog_nbr': '1010'}
+        response = self.session.get(
+            self.base_url, params={**params, "page": page}, timeout=self.timeout
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def pages(self, limit=None, **params):
+        """Yields non-empty pages in order, stopping at the first empty one."""
+        pool = ThreadPoolExecutor(max_workers=self.workers)
+        pending = deque()
+        next_page = 1
+        try:
+            while True:
+                while len(pending) < self.workers and (
+                    limit is None or next_page <= limit
+                ):
+                    pending.append(pool.submit(self.get_page, next_page, **params))
+                    next_page += 1
+                if not pending:
+                    return
+                page_results = pending.popleft().result()
+                if not page_results:
+                    return
+                yield page_results
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+
+
+def get_client():
+    global _client
+    if _client is None:
+        _client = SISClient()
+    return _client
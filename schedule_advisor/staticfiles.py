@@ -0,0 +1,36 @@
+from django.contrib.staticfiles.handlers import (
+    ASGIStaticFilesHandler,
+    StaticFilesHandler,
+)
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+
+class WhiteNoiseHandlerMixin:
+    """Serves static files the way WhiteNoiseMiddleware does (far-future caching
+    of hashed names, compressed variants), but in front of the application
+    instead of inside its middleware chain. WhiteNoiseMiddleware is sync-only,
+    so under ASGI it made Django run every request's middleware in a thread."""
+
+    def __init__(self, application):
+        super().__init__(application)
+        self.whitenoise = WhiteNoiseMiddleware()
+
+    def find_file(self, path):
+        if self.whitenoise.autorefresh:
+            return self.whitenoise.find_file(path)
+        return self.whitenoise.files.get(path)
+
+    def _should_handle(self, path):
+        # anything else under STATIC_URL is left to the application, e.g. for a 404
+        return super()._should_handle(path) and self.find_file(path) is not None
+
+    def serve(self, request):
+        return self.whitenoise.serve(self.find_file(request.path_info), request)
+
+
+class WhiteNoiseHandler(WhiteNoiseHandlerMixin, StaticFilesHandler):
+    pass
+
+
+class ASGIWhiteNoiseHandler(WhiteNoiseHandlerMixin, ASGIStaticFilesHandler):
+    pass
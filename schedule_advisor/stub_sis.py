@@ -0,0 +1,76 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class StubSISServer:
+    """Local stand-in for the SIS class search API, for tests and benchmarks.
+
+    Serves ``classes`` (SIS-shaped dicts) filtered by term/subject/catalog_nbr
+    and split into pages of ``page_size``. ``latency`` seconds are slept before
+    every response, and the first ``failures`` requests return a 503.
+
+    with StubSISServer(DANCE_EXAMPLE, page_size=2) as server:
+        SISClient(server.url).pages(term="1228")
+    """
+
+    def __init__(self, classes, page_size=100, latency=0.0, failures=0):
+        self.classes = classes
+        self.page_size = page_size
+        self.latency = latency
+        self.failures = failures
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), self.handler())
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}/?institution=UVA01"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def page(self, query):
+        classes = self.classes
+        for param, key in (
+            ("term", "strm"),
+            ("subject", "subject"),
+            ("catalog_nbr", "catalog_nbr"),
+        ):
+            if param in query:
+                classes = [c for c in classes if str(c[key]) == query[param][0]]
+        page = int(query.get("page", ["1"])[0])
+        return classes[(page - 1) * self.page_size : page * self.page_size]
+
+    def handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with server.lock:
+                    server.requests += 1
+                    fail = server.requests <= server.failures
+                time.sleep(server.latency)
+                if fail:
+                    self.send_response(503)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                body = json.dumps(server.page(parse_qs(urlparse(self.path).query)))
+                body = body.encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
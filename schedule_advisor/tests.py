@@ -1,8 +1,53 @@
-from django.test import TestCase
-from schedule_advisor.models import User, Class, Schedule
+import json
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, connections
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from schedule_advisor.benchmark import Benchmark, compare, synthetic_catalog
+from schedule_advisor.cache import (
+    cached_search,
+    card_key,
+    term_subjects,
+    term_version,
+)
+from schedule_advisor.forms import ClassSearchForm
+from schedule_advisor.generator import ScheduleGenerator
+from schedule_advisor.ingest import Ingest
+from schedule_advisor.instrumentation import RequestMetrics
+from schedule_advisor.layout import schedule_layout
+from schedule_advisor.models import (
+    User,
+    CatalogVersion,
+    Class,
+    RecentSearch,
+    Schedule,
+    classes_overlap,
+    hash_source_data,
+    meeting_blocks,
+)
 import requests
+from asgiref.sync import sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.utils.module_loading import import_string
 
-from schedule_advisor.settings import SIS_API_URL
+from schedule_advisor.routers import PIN_COOKIE
+from schedule_advisor.search import USER_FTS_TABLE, filter_names, paginate
+from schedule_advisor.seats import refresh_batch, stale_batches
+from schedule_advisor.sis import SISClient
+from schedule_advisor.staticfiles import ASGIWhiteNoiseHandler
+from schedule_advisor.stub_sis import StubSISServer
 from schedule_advisor.test_data import DANCE_EXAMPLE
 
 
@@ -27,7 +72,9 @@ class ScheduleAdvisorTestCase(TestCase):
         self.assertFalse(user.is_advisor)
 
     def test_data_loaded_correctly(self):
-        json = requests.get(f"{SIS_API_URL}&term=1228&subject=DANC").json()
+        # the stub serves what SIS returned when DANCE_EXAMPLE was recorded
+        with StubSISServer(DANCE_EXAMPLE) as server:
+            json = requests.get(f"{server.url}&term=1228&subject=DANC").json()
         add_to_database(json)
         qs = Class.objects.filter(semester="1228", subject="DANC")
         results = sorted([r.source_data for r in qs], key=lambda s: s["index"])
@@ -73,3 +120,1189 @@ class ScheduleAdvisorTestCase(TestCase):
         schedule.classes.add(cl)
         cl2 = Class.objects.get(semester="1228", subject="DANC", catalog_number="2220")
         self.assertTrue(schedule.class_can_be_added(cl2))
+
+
+class IngestTestCase(TestCase):
+    def test_writes_page(self):
+        ingest = Ingest("1228")
+        ingest.write_page(DANCE_EXAMPLE)
+        self.assertEqual(
+            len(DANCE_EXAMPLE), Class.objects.filter(semester="1228").count()
+        )
+        cl = Class.objects.get(semester="1228", class_number=10948)
+        self.assertEqual("How Dance Matters", cl.name)
+        self.assertEqual(DANCE_EXAMPLE[0], cl.source_data)
+
+    def test_updates_existing_classes(self):
+        Ingest("1228").write_page(DANCE_EXAMPLE)
+        changed = dict(DANCE_EXAMPLE[0], descr="How Dance Matters Now")
+        Ingest("1228").write_page([changed])
+        self.assertEqual(len(DANCE_EXAMPLE), Class.objects.count())
+        cl = Class.objects.get(semester="1228", class_number=10948)
+        self.assertEqual("How Dance Matters Now", cl.name)
+
+    def test_deletes_stale_classes(self):
+        Ingest("1228").write_page(DANCE_EXAMPLE)
+        ingest = Ingest("1228")
+        ingest.write_page(DANCE_EXAMPLE[1:])
+        ingest.delete_stale()
+        self.assertEqual(1, ingest.deleted)
+        self.assertFalse(Class.objects.filter(class_number=10948).exists())
+
+    def test_skips_unchanged_classes(self):
+        Ingest("1228").write_page(DANCE_EXAMPLE)
+        ingest = Ingest("1228")
+        changed = dict(DANCE_EXAMPLE[0], enrollment_available=1)
+        ingest.write_page([changed] + DANCE_EXAMPLE[1:])
+        self.assertEqual(
+            (0, 1, len(DANCE_EXAMPLE) - 1),
+            (ingest.inserted, ingest.updated, ingest.unchanged),
+        )
+        with self.assertNumQueries(1):  # only the hash lookup
+            with patch.object(Class, "from_sis") as from_sis:
+                Ingest("1228").write_page(DANCE_EXAMPLE[1:])
+        from_sis.assert_not_called()
+
+    def test_save_refreshes_hash(self):
+        Ingest("1228").write_page(DANCE_EXAMPLE)
+        cl = Class.objects.get(semester="1228", class_number=10948)
+        cl.source_data["enrl_stat"] = "O"
+        cl.save()
+        self.assertEqual(hash_source_data(cl.source_data), cl.source_hash)
+        self.assertNotEqual(hash_source_data(DANCE_EXAMPLE[0]), cl.source_hash)
+
+
+class SISClientTestCase(TestCase):
+    def test_fetches_pages_in_order(self):
+        with StubSISServer(DANCE_EXAMPLE, page_size=3) as server:
+            client = SISClient(server.url, workers=2)
+            pages = list(client.pages(term="1228"))
+        self.assertEqual([3, 3, 2], [len(page) for page in pages])
+        self.assertEqual(DANCE_EXAMPLE, [c for page in pages for c in page])
+
+    def test_stops_at_limit(self):
+        with StubSISServer(DANCE_EXAMPLE, page_size=1) as server:
+            pages = list(SISClient(server.url).pages(limit=2, term="1228"))
+        self.assertEqual(DANCE_EXAMPLE[:2], [c for page in pages for c in page])
+
+    def test_retries_failed_requests(self):
+        with StubSISServer(DANCE_EXAMPLE, failures=2) as server:
+            client = SISClient(server.url, workers=1, backoff=0)
+            self.assertEqual(DANCE_EXAMPLE, client.get_page(1, term="1228"))
+            self.assertEqual(3, server.requests)
+
+    def test_search_uses_shared_client(self):
+        with StubSISServer(DANCE_EXAMPLE, page_size=2) as server:
+            with patch("schedule_advisor.sis._client", SISClient(server.url)):
+                results = ClassSearchForm.get_results(
+                    {"semester": "1228", "subject": "DANC", "keyword": "improvisation"}
+                )
+        self.assertEqual(
+            ["Dance Improvisation", "Contact Improvisation"],
+            [r["descr"] for r in results],
+        )
+
+
+class GetDataFromSISTestCase(TestCase):
+    def setUp(self):
+        self.catalog = DANCE_EXAMPLE + [
+            dict(DANCE_EXAMPLE[0], subject="DRAM", class_nbr=19999)
+        ]
+
+    def test_refreshes_each_subject(self):
+        with StubSISServer(self.catalog, page_size=3) as server:
+            with patch("schedule_advisor.sis._client", SISClient(server.url)):
+                call_command(
+                    "get_data_from_sis",
+                    terms=["1228"],
+                    subjects=["DANC", "DRAM"],
+                    stdout=StringIO(),
+                )
+        self.assertEqual(len(self.catalog), Class.objects.count())
+        self.assertTrue(Class.objects.filter(subject="DRAM").exists())
+
+    def test_replays_recorded_dump(self):
+        with tempfile.TemporaryDirectory() as directory:
+            dump = os.path.join(directory, "1228.jsonl")
+            with StubSISServer(self.catalog, page_size=3) as server:
+                with patch("schedule_advisor.sis._client", SISClient(server.url)):
+                    call_command(
+                        "get_data_from_sis",
+                        terms=["1228"],
+                        dump=dump,
+                        stdout=StringIO(),
+                    )
+            Class.objects.all().delete()
+            call_command(
+                "get_data_from_sis",
+                terms=["1228"],
+                subjects=["DANC"],
+                from_file=dump,
+                stdout=StringIO(),
+            )
+        results = sorted(
+            (cl.source_data for cl in Class.objects.all()), key=lambda s: s["index"]
+        )
+        self.assertEqual(DANCE_EXAMPLE, results)
+
+    def test_failing_subject_does_not_stop_others(self):
+        Ingest("1228").write_page(DANCE_EXAMPLE)
+        with StubSISServer(self.catalog, failures=1) as server:
+            client = SISClient(server.url, workers=1, retries=0)
+            with patch("schedule_advisor.sis._client", client):
+                with self.assertRaises(CommandError):
+                    call_command(
+                        "get_data_from_sis",
+                        terms=["1228"],
+                        subjects=["DANC", "DRAM"],
+                        stdout=StringIO(),
+                        stderr=StringIO(),
+                    )
+        self.assertEqual(len(self.catalog), Class.objects.count())
+
+
+class MeetingBlocksTestCase(TestCase):
+    def test_meeting_blocks(self):
+        self.assertEqual([[0b10100, 960, 1035]], meeting_blocks(DANCE_EXAMPLE[0]))
+        self.assertEqual([[0, 0, 0]], meeting_blocks(DANCE_EXAMPLE[3]))
+
+    def test_meeting_days(self):
+        Ingest("1228").write_page(DANCE_EXAMPLE)
+        cl = Class.objects.get(semester="1228", class_number=10948)
+        self.assertEqual({"Tu": (960, 1035), "Th": (960, 1035)}, cl.meeting_days())
+
+    def test_tba_classes_do_not_overlap(self):
+        tba_1 = Class.from_sis(DANCE_EXAMPLE[3])
+        tba_2 = Class.from_sis(DANCE_EXAMPLE[7])
+        self.assertFalse(classes_overlap(tba_1, tba_2))
+
+    def test_back_to_back_classes_do_not_overlap(self):
+        first = Class.from_sis(DANCE_EXAMPLE[4])
+        second = Class.from_sis(
+            dict(
+                DANCE_EXAMPLE[5],
+                meetings=[
+                    dict(
+                        DANCE_EXAMPLE[5]["meetings"][0],
+                        start_time="15.30.00.000000-05:00",
+                    )
+                ],
+            )
+        )
+        self.assertFalse(classes_overlap(first, second))
+        second.meeting_blocks[0][1] -= 1
+        self.assertTrue(classes_overlap(first, second))
+
+
+class ConflictIndexTestCase(TestCase):
+    def setUp(self):
+        Ingest("1228").write_page(
+            [dict(result, enrl_stat="O") for result in DANCE_EXAMPLE]
+        )
+        user = User.objects.get_or_create(username="testuser")[0]
+        self.schedule = Schedule.objects.get_or_create(connected_user_id=user.id)[0]
+        self.schedule.classes.add(Class.objects.get(class_number=10948))
+
+    def test_matches_pairwise_checks(self):
+        scheduled = Class.objects.get(class_number=10948)
+        for cl in Class.objects.exclude(class_number=10948):
+            self.assertEqual(
+                not classes_overlap(scheduled, cl),
+                self.schedule.class_can_be_added(cl),
+            )
+
+    def test_checks_many_classes_with_one_query(self):
+        classes = list(Class.objects.all())
+        with self.assertNumQueries(1):
+            can_be_added = self.schedule.classes_can_be_added(classes)
+        self.assertEqual(
+            {10948: False, 11510: True, 12819: False},
+            {
+                cl.class_number: can_be_added[cl.id]
+                for cl in classes
+                if cl.class_number in (10948, 11510, 12819)
+            },
+        )
+
+    def test_index_is_rebuilt_after_adding(self):
+        cl = Class.objects.get(semester="1228", subject="DANC", catalog_number="2220")
+        self.assertTrue(self.schedule.class_can_be_added(cl))
+        self.schedule.add_class(cl)
+        self.assertFalse(self.schedule.class_can_be_added(cl))
+
+
+class SearchViewTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        Ingest("1228").write_page(DANCE_EXAMPLE)
+        self.user = User.objects.get_or_create(username="testuser")[0]
+        self.user.schedule.classes.add(Class.objects.get(class_number=10948))
+        self.client.force_login(self.user)
+
+    def search(self, **data):
+        return self.client.post("/search", {"semester": "1228", **data})
+
+    def test_query_count_does_not_depend_on_results(self):
+        self.search(subject="DANC")  # records the subject as recently searched
+        cache.clear()
+        with CaptureQueriesContext(connection) as one_result:
+            response = self.search(subject="DANC", catalog_number="1400")
+        self.assertEqual(1, len(response.context["results"]))
+        cache.clear()
+        with CaptureQueriesContext(connection) as all_results:
+            response = self.search(subject="DANC")
+        self.assertEqual(len(DANCE_EXAMPLE), len(response.context["results"]))
+        self.assertEqual(len(one_result), len(all_results))
+
+    def test_results_are_annotated(self):
+        response = self.search(subject="DANC")
+        actions = {
+            result.class_number: (result.can_be_added, result.in_schedule)
+            for result in response.context["results"]
+        }
+        self.assertEqual((False, True), actions[10948])
+        self.assertEqual((False, False), actions[12819])
+        self.assertContains(response, "Remove from Schedule", count=1)
+
+    def test_cards_do_not_load_source_data(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.search(subject="DANC", catalog_number="1400")
+        self.assertFalse(any("source_data" in q["sql"] for q in queries))
+        self.assertContains(response, "Kathryn Schetlick")
+        self.assertContains(
+            response,
+            "TuTh 4:00:00 PM - 5:15:00 PM from 08/23/2022 to 12/06/2022 "
+            "in Drama Education Bldg 217",
+        )
+        self.assertContains(response, "0/20 seats available")
+
+
+class KeywordSearchTestCase(TestCase):
+    def setUp(self):
+        Ingest("1228").write_page(DANCE_EXAMPLE)
+
+    def search(self, keyword):
+        results = ClassSearchForm.get_results_from_database(
+            {"semester": "1228", "keyword": keyword}
+        )
+        return [cl.class_number for cl in results]
+
+    def test_matches_substrings_of_name(self):
+        self.assertEqual([10946, 20325], self.search("improv"))
+        self.assertEqual([10948, 10946, 12152, 12819, 12494], self.search("Dance"))
+
+    def test_requires_every_keyword(self):
+        self.assertEqual([10946], self.search("dance improvisation"))
+
+    def test_matches_instructors_and_attributes(self):
+        self.assertEqual([10948, 10946, 11750], self.search("schetlick"))
+        self.assertEqual([10948, 12819], self.search("asud"))
+
+    def test_short_keywords(self):
+        self.assertEqual([10948], self.search("how da"))
+
+    def test_index_follows_updates_and_deletes(self):
+        ingest = Ingest("1228")
+        ingest.write_page([dict(DANCE_EXAMPLE[1], descr="Modern Improvisation")])
+        ingest.delete_stale()
+        self.assertEqual([11510], self.search("improv"))
+
+    def test_seat_updates_leave_index_alone(self):
+        def total_changes():
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT total_changes()")
+                return cursor.fetchone()[0]
+
+        before = total_changes()
+        Class.objects.filter(class_number=10948).update(enrollment_available=3)
+        self.assertEqual(1, total_changes() - before)  # the class row alone
+
+
+class PaginationTestCase(TestCase):
+    def setUp(self):
+        Ingest("1228").write_page(DANCE_EXAMPLE)
+        self.classes = ClassSearchForm.get_results_from_database({"semester": "1228"})
+
+    def test_orders_in_database(self):
+        self.assertEqual(
+            sorted(r["catalog_nbr"] for r in DANCE_EXAMPLE),
+            [cl.catalog_number for cl in self.classes],
+        )
+
+    def test_walks_every_page(self):
+        seen = []
+        page, cursor = paginate(self.classes, per_page=3)
+        seen += page
+        while cursor:
+            page, cursor = paginate(self.classes, cursor, per_page=3)
+            self.assertLessEqual(len(page), 3)
+            seen += page
+        self.assertEqual(list(self.classes), seen)
+
+    def test_bad_cursor_starts_over(self):
+        page, _ = paginate(self.classes, "not-a-cursor", per_page=3)
+        self.assertEqual(list(self.classes[:3]), page)
+
+    def test_search_view_links_next_page(self):
+        self.client.force_login(User.objects.get_or_create(username="testuser")[0])
+        with patch("schedule_advisor.search.RESULTS_PER_PAGE", 5):
+            response = self.client.post("/search", {"semester": "1228"})
+            self.assertEqual(5, len(response.context["results"]))
+            cursor = response.context["next_cursor"]
+            self.assertContains(response, cursor)
+            response = self.client.post(
+                "/search", {"semester": "1228", "cursor": cursor}
+            )
+        self.assertEqual(3, len(response.context["results"]))
+        self.assertIsNone(response.context["next_cursor"])
+
+
+def make_section(class_nbr, subject, catalog_nbr, component, days, start, end):
+    # start, end: e.g. "09.00"
+    meeting = dict(
+        DANCE_EXAMPLE[0]["meetings"][0],
+        days=days,
+        start_time=f"{start}.00.000000-05:00",
+        end_time=f"{end}.00.000000-05:00",
+    )
+    return dict(
+        DANCE_EXAMPLE[0],
+        class_nbr=class_nbr,
+        subject=subject,
+        catalog_nbr=catalog_nbr,
+        class_section=str(class_nbr % 1000).zfill(3),
+        component=component,
+        descr=f"{subject} {catalog_nbr}",
+        enrl_stat="O",
+        meetings=[meeting],
+    )
+
+
+class ScheduleGeneratorTestCase(TestCase):
+    def setUp(self):
+        Ingest("1228").write_page(
+            [
+                make_section(1, "CS", "2100", "LEC", "MoWe", "09.00", "10.15"),
+                make_section(2, "CS", "2100", "LEC", "TuTh", "14.00", "15.15"),
+                make_section(3, "CS", "2100", "LAB", "Fr", "09.00", "10.15"),
+                make_section(4, "APMA", "3080", "LEC", "MoWe", "09.30", "10.45"),
+                make_section(5, "APMA", "3080", "LEC", "TuTh", "11.00", "12.15"),
+                dict(
+                    make_section(6, "APMA", "3080", "LEC", "MoWe", "14.00", "15.15"),
+                    enrl_stat="C",
+                ),
+            ]
+        )
+
+    def schedules(self, courses, **preferences):
+        generator = ScheduleGenerator("1228", courses, **preferences)
+        return [
+            sorted(option.sections[0].class_number for option in options)
+            for _, options in generator.best(10)
+        ]
+
+    def test_finds_every_valid_schedule(self):
+        schedules = self.schedules([("CS", "2100"), ("APMA", "3080")])
+        self.assertEqual([[1, 3, 5], [2, 3, 4], [2, 3, 5]], sorted(schedules))
+
+    def test_ranks_by_preferences(self):
+        courses = [("CS", "2100"), ("APMA", "3080")]
+        self.assertEqual([2, 3, 5], self.schedules(courses, avoid_mornings=True)[0])
+        self.assertEqual([2, 3, 5], self.schedules(courses, compact=True)[0])
+
+    def test_best_schedules_are_found_first(self):
+        # sections in catalog order go from early mornings to evenings, so the
+        # schedules a plain depth-first search finds first are the worst ones
+        days = ["MoWe", "TuTh", "MoWeFr", "Fr"]
+        Ingest("1228").write_page(
+            [
+                make_section(
+                    2000 + course * 100 + section,
+                    "PREF",
+                    str(1000 + course),
+                    "LEC" if section < 4 else "DIS",
+                    days[(course + section) % len(days)],
+                    f"{8 + section % 4 * 3 + section // 4:02}.00",
+                    f"{8 + section % 4 * 3 + section // 4:02}.50",
+                )
+                for course in range(3)
+                for section in range(8)
+            ]
+        )
+        courses = [("PREF", str(1000 + course)) for course in range(3)]
+        generator = ScheduleGenerator(
+            "1228", courses, avoid_mornings=True, compact=True
+        )
+        scores = sorted(generator.score(options) for options in generator.solutions())
+        first = [
+            generator.score(options)
+            for _, options in zip(range(20), generator.solutions())
+        ]
+        self.assertGreater(min(first), scores[0])
+        best = generator.best(3, max_solutions=20)
+        self.assertEqual(scores[:3], [score for score, _ in best])
+        self.assertEqual(best[0][0], generator.score(best[0][1]))
+
+    def test_reports_courses_without_open_sections(self):
+        generator = ScheduleGenerator("1228", [("CS", "2100"), ("CS", "9999")])
+        self.assertEqual([("CS", "9999")], generator.missing)
+        self.assertEqual([], list(generator.solutions()))
+
+    def test_reports_components_without_open_sections(self):
+        Class.objects.filter(class_number=3).update(enrl_stat="C")
+        generator = ScheduleGenerator("1228", [("CS", "2100"), ("APMA", "3080")])
+        self.assertEqual([("CS", "2100", "LAB")], generator.missing)
+        self.assertEqual([], list(generator.solutions()))
+        response = self.client.get(
+            "/schedule/generate", {"semester": "1228", "courses": "CS 2100"}
+        )
+        self.assertEqual(400, response.status_code)
+        self.assertEqual(
+            {"courses": ["No open sections of CS 2100 LAB."]},
+            response.json()["errors"],
+        )
+
+    def test_many_sections(self):
+        sections = []
+        for course in range(6):
+            for section in range(12):
+                day = ["MoWe", "TuTh", "MoWeFr"][section % 3]
+                hour = 8 + section
+                sections.append(
+                    make_section(
+                        1000 + course * 100 + section,
+                        "SYN",
+                        str(1000 + course),
+                        "LEC",
+                        day,
+                        f"{hour:02}.00",
+                        f"{hour:02}.50",
+                    )
+                )
+        Ingest("1228").write_page(sections)
+        courses = [("SYN", str(1000 + course)) for course in range(6)]
+        generator = ScheduleGenerator("1228", courses, compact=True)
+        for score, options in generator.best(5):
+            self.assertEqual(6, len(options))
+            occupied = 0
+            for option in options:
+                self.assertFalse(occupied & option.mask)
+                occupied |= option.mask
+
+    def test_view_streams_schedules(self):
+        response = self.client.get(
+            "/schedule/generate",
+            {"semester": "1228", "courses": "cs 2100, APMA3080", "limit": 2},
+        )
+        lines = [json.loads(line) for line in b"".join(response).splitlines()]
+        self.assertEqual(2, len(lines))
+        self.assertEqual(
+            {"CS 2100", "APMA 3080"},
+            {f"{s['subject']} {s['catalog_number']}" for s in lines[0]["sections"]},
+        )
+
+    def test_view_rejects_unknown_courses(self):
+        response = self.client.get("/schedule/generate", {"courses": "CS 9999"})
+        self.assertEqual(400, response.status_code)
+
+
+class ScheduleLayoutTestCase(TestCase):
+    def setUp(self):
+        Ingest("1228").write_page(DANCE_EXAMPLE)
+        self.user = User.objects.get_or_create(username="testuser")[0]
+        self.schedule = self.user.schedule
+        self.schedule.classes.add(
+            *Class.objects.filter(class_number__in=[10948, 11510, 11750, 12152])
+        )
+        self.client.force_login(self.user)
+
+    def class_numbers(self, layout):
+        return {day["id"]: [cl.class_number for cl in day["classes"]] for day in layout}
+
+    def test_classes_are_grouped_and_ordered(self):
+        layout = self.class_numbers(schedule_layout(self.schedule))
+        self.assertEqual([11510, 10948], layout["Tuesday"])
+        self.assertEqual([11750], layout["Monday"])
+        self.assertEqual([], layout["Friday"])
+        self.assertEqual([12152], layout["na"])
+
+    def test_layout_is_cached_per_version(self):
+        schedule_layout(self.schedule)
+        with patch("schedule_advisor.layout.compute_layout") as compute_layout:
+            schedule_layout(self.schedule)
+        compute_layout.assert_not_called()
+
+        version = self.schedule.version
+        self.schedule.remove_class(Class.objects.get(class_number=11510))
+        self.assertEqual(version + 1, Schedule.objects.get(pk=self.schedule.pk).version)
+        layout = self.class_numbers(schedule_layout(self.schedule))
+        self.assertEqual([10948], layout["Tuesday"])
+
+    def test_layout_follows_reingested_meetings(self):
+        schedule_layout(self.schedule)
+        moved = dict(DANCE_EXAMPLE[0])
+        moved["meetings"] = [
+            dict(moved["meetings"][0], start_time="09.00.00.000000-05:00")
+        ]
+        Ingest("1228").write_page([moved])
+        layout = self.class_numbers(schedule_layout(self.schedule))
+        self.assertEqual([10948, 11510], layout["Tuesday"])
+
+    def test_schedule_view(self):
+        response = self.client.get("/schedule/")
+        self.assertContains(response, "<h2>Other</h2>", count=1)
+        self.assertContains(response, "No classes on Friday!")
+
+
+class CatalogCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        Ingest("1228").write_page(DANCE_EXAMPLE)
+
+    def search(self, **data):
+        return self.client.post("/search", {"semester": "1228", **data})
+
+    def test_repeated_search_is_served_from_cache(self):
+        self.search(subject="DANC", keyword="Dance")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.search(subject="DANC", keyword="  dance ")
+        self.assertEqual(5, len(response.context["results"]))
+        self.assertFalse(any("schedule_advisor_class" in q["sql"] for q in queries))
+
+    def test_ingest_invalidates_term(self):
+        data = {"semester": "1228", "subject": "DANC", "catalog_number": "1400"}
+        results, _ = cached_search(data)
+        self.assertEqual("How Dance Matters", results[0].name)
+        Ingest("1228").write_page([dict(DANCE_EXAMPLE[0], descr="Why Dance Matters")])
+        results, _ = cached_search(data)
+        self.assertEqual("Why Dance Matters", results[0].name)
+
+    def test_other_terms_keep_their_entries(self):
+        version = term_version("1232")
+        Ingest("1228").write_page(DANCE_EXAMPLE)
+        self.assertEqual(version, term_version("1232"))
+
+    def test_term_subjects(self):
+        self.assertEqual(["DANC"], term_subjects("1228"))
+        self.assertEqual([], term_subjects("1232"))
+        results, next_cursor = cached_search({"semester": "1228", "subject": "CS"})
+        self.assertEqual(([], None), (results, next_cursor))
+
+    def test_file_backend(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            backend = {
+                "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+                "LOCATION": cache_dir,
+            }
+            with self.settings(CACHES={"default": backend}):
+                data = {"semester": "1228", "subject": "DANC"}
+                first, _ = cached_search(data)
+                with self.assertNumQueries(0):
+                    second, _ = cached_search(data)
+        self.assertEqual(
+            [cl.class_number for cl in first], [cl.class_number for cl in second]
+        )
+
+
+class CardFragmentCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        Ingest("1228").write_page(DANCE_EXAMPLE)
+        self.user = User.objects.get_or_create(username="testuser")[0]
+        self.user.schedule.classes.add(Class.objects.get(class_number=10948))
+        self.client.force_login(self.user)
+
+    def search(self):
+        return self.client.post("/search", {"semester": "1228", "subject": "DANC"})
+
+    def test_bodies_are_rendered_once(self):
+        self.search()
+        with patch("schedule_advisor.cache.render_to_string") as render_to_string:
+            response = self.search()
+        render_to_string.assert_not_called()
+        self.assertContains(response, "How Dance Matters")
+        self.assertContains(response, "Remove from Schedule", count=1)
+
+    def test_actions_stay_per_user(self):
+        self.search()
+        other = User.objects.get_or_create(username="otheruser")[0]
+        self.client.force_login(other)
+        response = self.search()
+        self.assertContains(response, "How Dance Matters")
+        self.assertNotContains(response, "Remove from Schedule")
+
+    def test_ingest_rerenders_changed_classes(self):
+        self.search()
+        Ingest("1228").write_page([dict(DANCE_EXAMPLE[0], descr="Why Dance Matters")])
+        with patch(
+            "schedule_advisor.cache.render_to_string", return_value="rendered"
+        ) as render_to_string:
+            self.search()
+        self.assertEqual(1, render_to_string.call_count)
+
+    def test_schedule_page_uses_cached_bodies(self):
+        response = self.client.get("/schedule/")
+        cl = Class.objects.get(class_number=10948)
+        self.assertIn("How Dance Matters", cache.get(card_key(cl)))
+        self.assertContains(response, "How Dance Matters", count=2)
+
+
+class ClassAPITestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        Ingest("1228").write_page(DANCE_EXAMPLE)
+
+    def get(self, etag=None, **params):
+        headers = {"HTTP_IF_NONE_MATCH": etag} if etag else {}
+        return self.client.get("/api/classes", {"term": "1228", **params}, **headers)
+
+    def test_results(self):
+        response = self.get(subject="danc", catalog="1400")
+        self.assertEqual(200, response.status_code)
+        (result,) = response.json()["results"]
+        self.assertEqual(10948, result["class_number"])
+        self.assertEqual(["Kathryn Schetlick"], result["instructors"])
+        self.assertIsNone(response.json()["next"])
+
+    def test_cursor_pagination(self):
+        with patch("schedule_advisor.search.RESULTS_PER_PAGE", 5):
+            first = self.get(subject="DANC").json()
+            second = self.get(subject="DANC", cursor=first["next"]).json()
+        numbers = [r["catalog_number"] for r in first["results"] + second["results"]]
+        self.assertEqual(sorted(c["catalog_nbr"] for c in DANCE_EXAMPLE), numbers)
+        self.assertIsNone(second["next"])
+
+    def test_not_modified_until_ingest(self):
+        etag = self.get(q="dance")["ETag"]
+        response = self.get(etag, q="dance")
+        self.assertEqual(304, response.status_code)
+        self.assertEqual(etag, response["ETag"])
+        self.assertNotEqual(etag, self.get(q="ballet")["ETag"])
+
+        Ingest("1228").write_page([dict(DANCE_EXAMPLE[0], descr="Why Dance Matters")])
+        response = self.get(etag, q="dance")
+        self.assertEqual(200, response.status_code)
+        self.assertNotEqual(etag, response["ETag"])
+
+    def test_invalid_parameters(self):
+        response = self.get(catalog="14")
+        self.assertEqual(400, response.status_code)
+        self.assertIn("catalog_number", response.json()["errors"])
+
+
+class AsyncViewsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        Ingest("1228").write_page(DANCE_EXAMPLE)
+        self.user = User.objects.get_or_create(username="testuser")[0]
+        self.user.schedule.classes.add(Class.objects.get(class_number=10948))
+
+    async def test_search(self):
+        (
+            await self.async_client.aforce_login(self.user)
+            if hasattr(self.async_client, "aforce_login")
+            else await sync_to_async(self.async_client.force_login)(self.user)
+        )
+        # multipart bodies trip up AsyncClient's FakePayload in Django 4.1
+        response = await self.async_client.post(
+            "/search",
+            "semester=1228&subject=DANC",
+            content_type="application/x-www-form-urlencoded",
+        )
+        self.assertContains(response, "Remove from Schedule", count=1)
+
+    async def test_schedule(self):
+        await sync_to_async(self.async_client.force_login)(self.user)
+        response = await self.async_client.get("/schedule/")
+        self.assertContains(response, "How Dance Matters", count=2)
+
+    async def test_api(self):
+        response = await self.async_client.get("/api/classes", {"term": "1228"})
+        self.assertEqual(len(DANCE_EXAMPLE), len(response.json()["results"]))
+        response = await self.async_client.get(
+            "/api/classes", {"term": "1228"}, **{"if-none-match": response["ETag"]}
+        )
+        self.assertEqual(304, response.status_code)
+        response = await self.async_client.post("/api/classes")
+        self.assertEqual(405, response.status_code)
+
+    def test_middleware_is_async(self):
+        # one sync-only middleware makes Django run every request in a thread
+        for path in settings.MIDDLEWARE:
+            self.assertTrue(getattr(import_string(path), "async_capable", False), path)
+
+    @override_settings(WHITENOISE_USE_FINDERS=True)
+    async def test_static_files(self):
+        application = ASGIWhiteNoiseHandler(get_asgi_application())
+
+        async def get(path):
+            communicator = ApplicationCommunicator(
+                application,
+                {
+                    "type": "http",
+                    "method": "GET",
+                    "path": path,
+                    "headers": [(b"host", b"testserver")],
+                },
+            )
+            await communicator.send_input({"type": "http.request"})
+            start = await communicator.receive_output()
+            body = await communicator.receive_output()
+            return start["status"], dict(start["headers"]), body.get("body", b"")
+
+        status, headers, body = await get("/static/schedule_advisor/main.css")
+        self.assertEqual(200, status)
+        self.assertTrue(headers[b"Content-Type"].startswith(b"text/css"))
+        self.assertIn(b"Cache-Control", headers)
+        self.assertTrue(body)
+        status, _, _ = await get("/static/schedule_advisor/missing.css")
+        self.assertEqual(404, status)
+
+
+class SeatRefreshTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        Ingest("1228").write_page(DANCE_EXAMPLE)
+        Class.objects.update(enrollment_updated_at=None)
+        self.user = User.objects.get_or_create(username="testuser")[0]
+        self.user.schedule.classes.add(Class.objects.get(class_number=10948))
+
+    def test_batches_cover_scheduled_and_searched_sections(self):
+        self.assertEqual([("1228", "DANC", "1400")], stale_batches())
+        RecentSearch.objects.create(
+            semester="1228", subject="DANC", searched_at=timezone.now()
+        )
+        self.assertEqual([("1228", "DANC", None)], stale_batches())
+        Class.objects.update(enrollment_updated_at=timezone.now())
+        self.assertEqual([], stale_batches())
+
+    def test_batches_are_ordered_by_staleness(self):
+        Ingest("1232").write_page([dict(DANCE_EXAMPLE[1], strm="1232")])
+        self.user.schedule.classes.add(Class.objects.get(semester="1232"))
+        Class.objects.filter(semester="1232").update(
+            enrollment_updated_at=timezone.now() - timedelta(hours=1)
+        )
+        self.assertEqual(["1228", "1232"], [b[0] for b in stale_batches()])
+        Class.objects.filter(semester="1228").update(
+            enrollment_updated_at=timezone.now() - timedelta(hours=2)
+        )
+        self.assertEqual(["1228", "1232"], [b[0] for b in stale_batches()])
+        Class.objects.filter(semester="1232").update(enrollment_updated_at=None)
+        self.assertEqual(["1232", "1228"], [b[0] for b in stale_batches()])
+
+    def test_refresh_writes_only_changed_enrollment(self):
+        catalog = [
+            dict(DANCE_EXAMPLE[0], enrollment_available=3, enrl_stat="O")
+        ] + DANCE_EXAMPLE[1:]
+        version = term_version("1228")
+        with StubSISServer(catalog) as server:
+            with patch("schedule_advisor.sis._client", SISClient(server.url)):
+                self.assertEqual((8, 1), refresh_batch("1228", "DANC"))
+        cl = Class.objects.get(class_number=10948)
+        self.assertEqual(("O", 3), (cl.enrl_stat, cl.enrollment_available))
+        self.assertEqual(hash_source_data(catalog[0]), cl.source_hash)
+        self.assertFalse(Class.objects.filter(enrollment_updated_at=None).exists())
+        self.assertNotEqual(version, term_version("1228"))
+
+    def test_searches_are_recorded(self):
+        self.client.post("/search", {"semester": "1228", "keyword": "ballet"})
+        self.assertEqual(
+            [("1228", "DANC")],
+            list(RecentSearch.objects.values_list("semester", "subject")),
+        )
+
+    def test_command(self):
+        with StubSISServer(DANCE_EXAMPLE) as server:
+            with patch("schedule_advisor.sis._client", SISClient(server.url)):
+                out = StringIO()
+                call_command("refresh_seats", stdout=out)
+        self.assertIn("1228 DANC 1400: 0/1 changed", out.getvalue())
+        self.assertEqual([], stale_batches())
+
+
+class RequestMetricsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        Ingest("1228").write_page(DANCE_EXAMPLE)
+        self.user = User.objects.get_or_create(username="testuser")[0]
+        self.client.force_login(self.user)
+
+    def search(self):
+        return self.client.post("/search", {"semester": "1228", "subject": "DANC"})
+
+    def test_timings_are_reported(self):
+        with self.assertLogs("schedule_advisor.requests", "INFO") as logs:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.search()
+        self.assertIn(f'desc="{len(queries)} queries"', response["Server-Timing"])
+        self.assertIn("tpl;dur=", response["Server-Timing"])
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual("search", record["view"])
+        self.assertEqual(len(queries), record["queries"])
+        self.assertGreater(record["template_ms"], 0)
+        self.assertGreaterEqual(record["total_ms"], record["template_ms"])
+
+    @override_settings(REQUEST_METRICS_SAMPLE_RATE=0)
+    def test_unsampled_requests_are_not_reported(self):
+        self.assertNotIn("Server-Timing", self.search())
+
+    @override_settings(REQUEST_METRICS_SLOW_MS=0)
+    def test_slow_requests_log_duplicated_queries(self):
+        with self.assertLogs("schedule_advisor.requests", "WARNING") as logs:
+            self.search()
+        slow = json.loads(logs.records[0].getMessage())["slow_request"]
+        self.assertEqual("search", slow["view"])
+        for duplicate in slow["duplicate_queries"]:
+            self.assertGreater(duplicate["count"], 1)
+
+    def test_duplicates(self):
+        metrics = RequestMetrics()
+        for sql in ["SELECT a"] + ["SELECT b"] * 2 + ["SELECT c"] * 3:
+            metrics.add_query(sql, 0.001)
+        self.assertEqual(
+            [("SELECT c", 3), ("SELECT b", 2)],
+            [(d["sql"], d["count"]) for d in metrics.duplicates()],
+        )
+
+    async def test_async_view(self):
+        response = await self.async_client.get("/api/classes", {"term": "1228"})
+        self.assertRegex(response["Server-Timing"], r'desc="[1-9]\d* queries"')
+
+
+class BenchmarkTestCase(TestCase):
+    def test_synthetic_catalog(self):
+        catalog = synthetic_catalog(500)
+        self.assertEqual(catalog, synthetic_catalog(500))
+        self.assertEqual(500, len({result["class_nbr"] for result in catalog}))
+        Ingest("1228").write_page(catalog)
+        self.assertEqual(500, Class.objects.filter(semester="1228").count())
+        self.assertTrue(all(cl.meeting_blocks[0][0] for cl in Class.objects.all()))
+
+    def test_run(self):
+        results = Benchmark(100, repeat=1).run()
+        self.assertEqual(100, Class.objects.count())
+        self.assertEqual(0, results["classes_overlap"]["queries"])
+        self.assertGreater(results["schedule_view"]["queries"], 0)
+        report = {"results": {"100": results}}
+        self.assertEqual(len(results), len(compare(report, report)))
+
+
+class AdvisorDashboardTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        Ingest("1228").write_page(DANCE_EXAMPLE)
+        self.advisor = User.objects.create(username="advisor", is_advisor=True)
+        self.client.force_login(self.advisor)
+
+    def add_advisees(self, count):
+        for i in range(count):
+            advisee = User.objects.create(
+                username=f"advisee{User.objects.count()}", advisor=self.advisor
+            )
+            if i % 2:  # the others keep their empty, private schedule
+                advisee.schedule.classes.add(*Class.objects.all()[:2])
+                Schedule.objects.filter(connected_user=advisee).update(
+                    visible=True, approved=True
+                )
+
+    def dashboard(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/schedules", {"q": "advisee"})
+        self.assertFalse(any(q["sql"].startswith("INSERT") for q in queries))
+        return response, len(queries)
+
+    def test_query_count_does_not_depend_on_caseload(self):
+        self.add_advisees(2)
+        self.dashboard()  # the first search also looks up the index tables
+        _, few = self.dashboard()
+        self.add_advisees(20)
+        response, many = self.dashboard()
+        self.assertEqual(few, many)
+        self.assertContains(response, "Schedule approved", count=2 * 11)
+        self.assertContains(response, "2 classes", count=2 * 11)
+
+    def test_only_own_advisees_schedules_are_shown(self):
+        other = User.objects.create(username="other")
+        other.schedule.classes.add(Class.objects.get(class_number=10948))
+        Schedule.objects.filter(connected_user=other).update(visible=True)
+        response = self.client.post("/schedules", {"advisee_id": other.id})
+        self.assertNotContains(response, "How Dance Matters")
+        other.advisor = self.advisor
+        other.save()
+        response = self.client.post("/schedules", {"advisee_id": other.id})
+        self.assertContains(response, "How Dance Matters")
+
+
+class ScheduleReviewTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        Ingest("1228").write_page(DANCE_EXAMPLE)
+        self.advisor = User.objects.create(username="advisor", is_advisor=True)
+        self.client.force_login(self.advisor)
+        self.pending = [self.add_schedule(f"pending{i}") for i in range(3)]
+        self.decided = self.add_schedule("decided", approved=False)
+        self.hidden = self.add_schedule("hidden", visible=False)
+        self.other = self.add_schedule("other", advisor=None)
+
+    def add_schedule(self, username, visible=True, approved=None, advisor=True):
+        user = User.objects.create(
+            username=username, advisor=self.advisor if advisor else None
+        )
+        user.schedule.classes.add(*Class.objects.all()[:3])
+        Schedule.objects.filter(connected_user=user).update(
+            visible=visible, approved=approved
+        )
+        return Schedule.objects.get(connected_user=user)
+
+    def test_lists_pending_schedules_in_fixed_queries(self):
+        with CaptureQueriesContext(connection) as few:
+            response = self.client.get("/schedules/review")
+        self.assertEqual(
+            [s.id for s in self.pending], [s.id for s in response.context["schedules"]]
+        )
+        self.assertContains(response, "How Dance Matters", count=3 * 2)
+        self.pending.append(self.add_schedule("pending3"))
+        with CaptureQueriesContext(connection) as many:
+            self.client.get("/schedules/review")
+        self.assertEqual(len(few), len(many))
+
+    def test_bulk_decision(self):
+        selected = [
+            f"{s.id}-{s.version}"
+            for s in self.pending + [self.decided, self.hidden, self.other]
+        ]
+        self.pending[2].classes_changed()  # the student edited it after the page loaded
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                "/schedules/review", {"schedule": selected, "decision": "true"}
+            )
+        self.assertEqual(1, sum(q["sql"].startswith("UPDATE") for q in queries))
+        self.assertEqual(
+            [
+                "You have approved 3 schedules!",
+                "1 schedule(s) changed since you loaded them and were not updated.",
+                "2 schedule(s) are no longer shared with you and were not updated.",
+            ],
+            [str(message) for message in get_messages(response.wsgi_request)],
+        )
+        approved = set(
+            Schedule.objects.filter(approved=True).values_list("id", flat=True)
+        )
+        # decided schedules can be revised; hidden, other and changed ones are skipped
+        self.assertEqual(
+            {self.pending[0].id, self.pending[1].id, self.decided.id}, approved
+        )
+
+    def test_large_selection(self):
+        users = User.objects.bulk_create(
+            User(username=f"student{i}", advisor=self.advisor) for i in range(600)
+        )
+        # bulk_create skips the post_save signal that creates schedules
+        schedules = Schedule.objects.bulk_create(
+            Schedule(connected_user=user, visible=True) for user in users
+        )
+        selected = [f"{s.id}-{s.version}" for s in schedules]
+        response = self.client.post(
+            "/schedules/review", {"schedule": selected, "decision": "false"}
+        )
+        self.assertEqual(302, response.status_code)
+        self.assertEqual(
+            600,
+            Schedule.objects.filter(connected_user__in=users, approved=False).count(),
+        )
+
+
+class StudentSearchTestCase(TestCase):
+    def setUp(self):
+        self.advisor = User.objects.create(username="advisor", is_advisor=True)
+        self.client.force_login(self.advisor)
+        User.objects.create(username="ms3ab", first_name="Maria", last_name="Santos")
+        User.objects.create(
+            username="jd4cd", first_name="John", last_name="Doe", advisor=self.advisor
+        )
+        User.objects.create(username="jm5ef", first_name="Jo", last_name="Marsh")
+
+    def names(self, query):
+        return sorted(
+            filter_names(User.objects.filter(is_advisor=False), query).values_list(
+                "username", flat=True
+            )
+        )
+
+    def test_filter_names(self):
+        self.assertEqual(["ms3ab"], self.names("SANTOS"))
+        self.assertEqual(["jd4cd", "jm5ef"], self.names("j"))
+        self.assertEqual(["jm5ef"], self.names("jo mar"))
+        self.assertEqual([], self.names("maria doe"))
+        with CaptureQueriesContext(connection) as queries:
+            self.names("santos")
+        self.assertTrue(any(USER_FTS_TABLE in q["sql"] for q in queries))
+
+    def test_index_lookup_is_cached(self):
+        self.names("santos")
+        with CaptureQueriesContext(connection) as queries:
+            self.names("santos")
+        self.assertEqual(1, len(queries))
+        self.assertNotIn("sqlite_master", queries[0]["sql"])
+
+    def test_index_follows_renames(self):
+        User.objects.filter(username="ms3ab").update(last_name="Oliveira")
+        self.assertEqual([], self.names("santos"))
+        self.assertEqual(["ms3ab"], self.names("oliv"))
+        User.objects.filter(username="ms3ab").delete()
+        self.assertEqual([], self.names("oliv"))
+
+    def test_dashboard_results_are_limited(self):
+        User.objects.bulk_create(
+            User(username=f"student{i}", last_name="Smith") for i in range(4)
+        )
+        with patch("schedule_advisor.views.STUDENT_RESULTS", 3):
+            response = self.client.get("/schedules", {"q": "smith"})
+        self.assertEqual(3, len(response.context["query"]))
+        self.assertContains(response, "Showing the first 3 matches")
+
+    def test_typeahead(self):
+        response = self.client.get("/api/students", {"q": "doe"})
+        self.assertEqual(
+            [
+                {
+                    "id": User.objects.get(username="jd4cd").id,
+                    "username": "jd4cd",
+                    "name": "John Doe",
+                    "is_advisee": True,
+                    "has_advisor": True,
+                }
+            ],
+            response.json()["results"],
+        )
+        self.assertEqual([], self.client.get("/api/students").json()["results"])
+        self.client.force_login(User.objects.get(username="ms3ab"))
+        self.assertEqual(
+            403, self.client.get("/api/students", {"q": "doe"}).status_code
+        )
+
+
+class ReadOnlyRequestTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        Ingest("1228").write_page(DANCE_EXAMPLE)
+        self.advisor = User.objects.create(username="advisor", is_advisor=True)
+        self.student = User.objects.create(username="student", advisor=self.advisor)
+        self.student.schedule.classes.add(Class.objects.get(class_number=10948))
+        Schedule.objects.filter(connected_user=self.student).update(visible=True)
+
+    def test_schedule_is_created_with_user(self):
+        self.assertEqual(
+            0, User.objects.create(username="new").schedule.classes.count()
+        )
+
+    def assertReadOnly(self, user, paths):
+        self.client.force_login(user)
+        for path in paths:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(path)
+            self.assertEqual(200, response.status_code, path)
+            statements = [q["sql"].split()[0] for q in queries]
+            self.assertEqual([], [s for s in statements if s != "SELECT"], path)
+            schedule_lookups = [
+                q
+                for q in queries
+                if 'FROM "schedule_advisor_schedule" WHERE' in q["sql"]
+                and "connected_user_id" in q["sql"]
+            ]
+            self.assertLessEqual(len(schedule_lookups), 1, path)
+
+    def test_student_pages_do_not_write(self):
+        self.assertReadOnly(self.student, ["/", "/schedule/", "/api/classes?term=1228"])
+
+    def test_advisor_pages_do_not_write(self):
+        self.assertReadOnly(self.advisor, ["/schedules", "/schedules/review"])
+
+    def test_anonymous_users_are_redirected(self):
+        users = User.objects.count()
+        for path in ["/schedule/", "/schedules", "/schedules/review"]:
+            self.assertEqual(302, self.client.get(path).status_code, path)
+        self.assertEqual(users, User.objects.count())
+
+
+@override_settings(DATABASE_REPLICAS=["replica"])
+class ReplicaRoutingTestCase(TestCase):
+    # two separate SQLite test databases, with nothing copying between them, so
+    # every read shows which database it went to
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        cache.clear()
+        Ingest("1228").write_page(DANCE_EXAMPLE)
+        self.user = User.objects.create(username="testuser")
+        self.client.force_login(self.user)
+
+    def queries(self, alias, request):
+        with CaptureQueriesContext(connections[alias]) as queries:
+            response = request()
+        return response, [q["sql"] for q in queries]
+
+    def get_classes(self, etag=None, **params):
+        headers = {"HTTP_IF_NONE_MATCH": etag} if etag else {}
+        return self.client.get("/api/classes", {"term": "1228", **params}, **headers)
+
+    def test_catalog_cache_is_filled_from_primary(self):
+        # the replica hasn't caught up with the ingest in setUp
+        response, replica = self.queries("replica", self.get_classes)
+        self.assertEqual(len(DANCE_EXAMPLE), len(response.json()["results"]))
+        self.assertFalse(any("schedule_advisor_class" in sql for sql in replica))
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+        response = self.get_classes(subject="DANC")
+        self.assertEqual(len(DANCE_EXAMPLE), len(response.json()["results"]))
+
+    def test_replica_catching_up(self):
+        response = self.get_classes(catalog="1400")
+        Class.objects.using("replica").bulk_create(Class.objects.all())
+        CatalogVersion.objects.using("replica").bulk_create(
+            CatalogVersion.objects.all()
+        )
+        caught_up = self.get_classes(catalog="1400")
+        self.assertEqual(1, len(caught_up.json()["results"]))
+        self.assertEqual(response.json(), caught_up.json())
+        self.assertEqual(response["ETag"], caught_up["ETag"])
+        Ingest("1228").write_page([dict(DANCE_EXAMPLE[0], descr="Why Dance Matters")])
+        # the replica lags behind this ingest, so the old ETag no longer matches
+        response = self.get_classes(response["ETag"], catalog="1400")
+        self.assertEqual(200, response.status_code)
+        self.assertEqual("Why Dance Matters", response.json()["results"][0]["name"])
+
+    def test_commands_use_primary(self):
+        self.assertEqual(len(DANCE_EXAMPLE), Class.objects.count())
+
+    def test_writes_read_from_primary(self):
+        Class.objects.filter(class_number=12819).update(enrl_stat="O")
+        response, replica = self.queries(
+            "replica",
+            lambda: self.client.post(
+                "/schedule/update",
+                {
+                    "action": "Add to Schedule",
+                    "semester": "1228",
+                    "class_number": 12819,
+                },
+            ),
+        )
+        self.assertEqual([], replica)
+        self.assertEqual(1, self.user.schedule.classes.count())
+
+    def test_reads_are_pinned_after_own_write(self):
+        Class.objects.filter(class_number=12819).update(enrl_stat="O")
+        response = self.client.post(
+            "/schedule/update",
+            {"action": "Add to Schedule", "semester": "1228", "class_number": 12819},
+        )
+        self.assertIn(PIN_COOKIE, response.cookies)
+        self.assertEqual(1, self.user.schedule.classes.count())
+        response, replica = self.queries(
+            "replica", lambda: self.client.get("/schedule/")
+        )
+        self.assertEqual([], replica)
+        self.assertContains(response, 'id="class-12819"', count=2)
+        self.client.cookies[PIN_COOKIE] = "0"  # the pin expired
+        _, replica = self.queries("replica", lambda: self.client.get("/schedule/"))
+        self.assertTrue(any("schedule_advisor_schedule" in sql for sql in replica))
@@ -13,6 +13,7 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+
 from django.contrib import admin
 from django.urls import path, include
 from .views import (
@@ -24,6 +25,10 @@ from .views import (
     advisee_change_view,
     class_schedule_visible_view,
     schedule_approval_view,
+    schedule_generator_view,
+    schedule_review_view,
+    class_api_view,
+    student_search_api_view,
 )
 
 urlpatterns = [
@@ -34,7 +39,11 @@ urlpatterns = [
     path("schedule/", schedule_view, name="schedule"),
     path("schedule/update", class_schedule_change_view, name="update_schedule"),
     path("schedule/visible", class_schedule_visible_view, name="visible_schedule"),
+    path("schedule/generate", schedule_generator_view, name="generate_schedule"),
     path("schedules", advisor_view, name="schedules"),
     path("schedules/update", advisee_change_view, name="update_advisees"),
     path("schedules/approve", schedule_approval_view, name="approve_schedule"),
+    path("schedules/review", schedule_review_view, name="review_schedules"),
+    path("api/classes", class_api_view, name="class_api"),
+    path("api/students", student_search_api_view, name="student_api"),
 ]
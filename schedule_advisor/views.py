@@ -1,105 +1,134 @@
-from django.db.models import Q
-from django.http import HttpResponseRedirect
+import hashlib
+import json
+
+from django.db import transaction
+from django.db.models import Prefetch
+from asgiref.sync import sync_to_async
+from django.http import (
+    HttpResponseNotAllowed,
+    HttpResponseRedirect,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from django.shortcuts import render
-from schedule_advisor.forms import ClassSearchForm, AdviseeChoiceForm
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+from schedule_advisor.cache import (
+    acached_search,
+    aterm_version,
+    render_card_bodies,
+    search_key,
+)
+from schedule_advisor.forms import (
+    ClassSearchForm,
+    AdviseeChoiceForm,
+    ScheduleGeneratorForm,
+)
+from schedule_advisor.generator import ScheduleGenerator
+from schedule_advisor.layout import aschedule_layout, schedule_layout, schedule_layouts
 from schedule_advisor.models import Schedule, Class, User
+from schedule_advisor.search import STUDENT_RESULTS, TYPEAHEAD_RESULTS, filter_names
+from schedule_advisor.seats import arecord_searches
 from django.contrib import messages
 
 
-def search_view(request):
+async def load_user(request):
+    # request.user is loaded lazily by a synchronous query; Django 4.1 has no auser()
+    await sync_to_async(lambda: request.user.is_authenticated)()
+    return request.user
+
+
+def is_advisor(user) -> bool:
+    # AnonymousUser has no is_advisor
+    return user.is_authenticated and user.is_advisor
+
+
+def is_student(user) -> bool:
+    return user.is_authenticated and not user.is_advisor
+
+
+@sync_to_async
+def render_with_cards(request, template_name, context, classes):
+    # template tags and the card fragment cache are synchronous
+    render_card_bodies(classes)
+    return render(request, template_name, context)
+
+
+async def search_view(request):
     results = None
+    next_cursor = None
     if request.method == "POST":
         form = ClassSearchForm(request.POST)
         if form.is_valid():
             # results = ClassSearchForm.get_results(form.cleaned_data)
-            results = ClassSearchForm.get_results_from_database(form.cleaned_data)
+            results, next_cursor = await acached_search(
+                form.cleaned_data, request.POST.get("cursor")
+            )
+            await arecord_searches(
+                form.cleaned_data["semester"], {cl.subject for cl in results}
+            )
+            user = await load_user(request)
+            if user.is_authenticated and not user.is_advisor:
+                # one pass over the results instead of queries from every class card
+                await sync_to_async(lambda: user.schedule.annotate_classes(results))()
     else:
         form = ClassSearchForm()
-    return render(
-        request, "schedule_advisor/index.html", {"form": form, "results": results}
+    return await render_with_cards(
+        request,
+        "schedule_advisor/index.html",
+        {"form": form, "results": results, "next_cursor": next_cursor},
+        results or [],
     )
+
+
 def home_view(request):
-    return render(
-        request, "schedule_advisor/home.html"
-    )
+    return render(request, "schedule_advisor/home.html")
 
 
-def schedule_view(request):
-    days_of_week = [
-        "Sunday",
-        "Monday",
-        "Tuesday",
-        "Wednesday",
-        "Thursday",
-        "Friday",
-        "Saturday",
-    ]
-    days_from_abbrev = {day[:2]: day for day in days_of_week}
-    if not request.user.is_authenticated:
+async def schedule_view(request):
+    user = await load_user(request)
+    if not user.is_authenticated:
         messages.add_message(request, messages.ERROR, "You are not logged in!")
         return HttpResponseRedirect("/")
-    u = User.objects.get_or_create(username=request.user.username)[0]
-    if u.is_advisor:
+    if user.is_advisor:
         messages.add_message(request, messages.ERROR, "You are not a student!")
         return HttpResponseRedirect("/")
-    schedule = Schedule.objects.get_or_create(connected_user_id=u.id)[0]
-    schedule_by_day = {day: list() for day in days_of_week}
-    for cl in schedule.classes.all():
-        for day in cl.meeting_days():
-            if day not in days_from_abbrev:
-                schedule_by_day[day] = [cl]
-            else:
-                schedule_by_day[days_from_abbrev[day]].append(cl)
-    for day, classes in schedule_by_day.items():
-        if day not in days_of_week:
-            classes.sort(key=lambda c: c.name)
-            continue
-        abbrev = day[:2]
-        classes.sort(
-            key=lambda c: tuple(
-                int(i) for i in c.meeting_days()[abbrev][0].split(".")[:3]
-            )
-        )
-    return render(
+    # created along with the user; cached on request.user for the class cards too
+    schedule = await sync_to_async(lambda: user.schedule)()
+    layout = await aschedule_layout(schedule)
+    return await render_with_cards(
         request,
         "schedule_advisor/schedule.html",
-        {
-            "schedule_by_day": schedule_by_day,
-            "days_of_week": days_of_week,
-            "schedule": schedule,
-        },
+        {"layout": layout, "schedule": schedule},
+        [cl for day in layout for cl in day["classes"]],
     )
 
 
 def class_schedule_change_view(request):
-    u = User.objects.get_or_create(username=request.user.username)[0]
-    if u.is_advisor:
+    u = request.user
+    if not is_student(u):
         messages.add_message(request, messages.ERROR, "You are not a student!")
         return HttpResponseRedirect("/")
     if request.method == "POST":
         action = request.POST["action"]
         try:
             if action == "Add to Schedule":
-                schedule = Schedule.objects.get_or_create(
-                    connected_user_id=request.user.id
-                )[0]
-                new_class = Class.objects.get_or_create(
+                schedule = u.schedule
+                new_class = Class.objects.get(
                     semester=request.POST["semester"],
                     class_number=int(request.POST["class_number"]),
-                )[0]
+                )
                 schedule.add_class(new_class)
                 schedule.reset_advisor()
                 messages.add_message(
                     request, messages.SUCCESS, "Course successfully added to schedule!"
                 )
             elif action == "Remove from Schedule":
-                schedule = Schedule.objects.get_or_create(
-                    connected_user_id=request.user.id
-                )[0]
-                old_class = Class.objects.get_or_create(
+                schedule = u.schedule
+                old_class = Class.objects.get(
                     semester=request.POST["semester"],
                     class_number=int(request.POST["class_number"]),
-                )[0]
+                )
                 schedule.remove_class(old_class)
                 schedule.reset_advisor()
                 messages.add_message(
@@ -118,100 +147,113 @@ def class_schedule_change_view(request):
 
 
 def advisor_view(request):
-    u = User.objects.get_or_create(username=request.user.username)[0]
-    if not u.is_advisor:
+    u = request.user
+    if not is_advisor(u):
         messages.add_message(request, messages.ERROR, "You are not an advisor!")
         return HttpResponseRedirect("/")
     else:
         schedules = None
-        days_of_week = None
-        schedule_by_day = None
+        layout = None
         query = None
-        advisees = User.objects.filter(advisor=request.user)
+        truncated = False
+        # one query for the whole caseload, however many advisees there are
+        advisees = (
+            User.objects.filter(advisor=u)
+            .with_schedule_summary()
+            .order_by("last_name", "first_name", "username")
+        )
         if request.method == "GET":
             query = request.GET.get("q", None)
             if query:
-                query = User.objects.filter(
-                    Q(is_advisor=False)
-                    & (
-                        Q(first_name__icontains=query)
-                        | Q(last_name__icontains=query)
-                        | Q(username__icontains=query)
-                    )
+                # one row past the limit tells whether there were more matches
+                query = list(
+                    search_students(query).with_schedule_summary()[
+                        : STUDENT_RESULTS + 1
+                    ]
                 )
+                truncated = len(query) > STUDENT_RESULTS
+                query = query[:STUDENT_RESULTS]
         elif request.method == "POST":
-            advisee_id = request.POST.get("advisee_id")
-            schedules = Schedule.objects.filter(connected_user_id=advisee_id)
-            days_of_week = [
-                "Sunday",
-                "Monday",
-                "Tuesday",
-                "Wednesday",
-                "Thursday",
-                "Friday",
-                "Saturday",
-            ]
-            days_from_abbrev = {day[:2]: day for day in days_of_week}
-            u = User.objects.get_or_create(id=advisee_id)[0]
-            schedule = Schedule.objects.get_or_create(connected_user_id=u.id)[0]
-            schedule_by_day = {day: list() for day in days_of_week}
-            for cl in schedule.classes.all():
-                for day in cl.meeting_days():
-                    if day not in days_from_abbrev:
-                        schedule_by_day[day] = [cl]
-                    else:
-                        schedule_by_day[days_from_abbrev[day]].append(cl)
-            for day, classes in schedule_by_day.items():
-                if day not in days_of_week:
-                    classes.sort(key=lambda c: c.name)
-                    continue
-                abbrev = day[:2]
-                classes.sort(
-                    key=lambda c: tuple(
-                        int(i) for i in c.meeting_days()[abbrev][0].split(".")[:3]
-                    )
+            # only the advisor's own advisees, whose schedules they can approve
+            schedules = list(
+                Schedule.objects.filter(
+                    connected_user_id=request.POST.get("advisee_id"),
+                    connected_user__advisor=u,
                 )
+            )
+            if schedules:
+                layout = schedule_layout(schedules[0])
+                render_card_bodies(cl for day in layout for cl in day["classes"])
         return render(
             request,
             "schedule_advisor/advisor_schedules.html",
             {
                 "advisees": advisees,
                 "schedules": schedules,
-                "days_of_week": days_of_week,
-                "schedule_by_day": schedule_by_day,
+                "layout": layout,
                 "query": query,
+                "truncated": truncated,
+                "limit": STUDENT_RESULTS,
             },
         )
 
 
+def search_students(query):
+    return filter_names(User.objects.filter(is_advisor=False), query).order_by(
+        "last_name", "first_name", "username"
+    )
+
+
+def student_search_api_view(request):
+    if request.method not in ("GET", "HEAD"):
+        return HttpResponseNotAllowed(["GET", "HEAD"])
+    if not request.user.is_authenticated or not request.user.is_advisor:
+        return JsonResponse(
+            {"errors": {"user": ["You are not an advisor!"]}}, status=403
+        )
+    query = request.GET.get("q", "").strip()
+    results = []
+    if query:
+        # values() skips building a User per row; this runs on every keystroke
+        students = search_students(query).values(
+            "id", "username", "first_name", "last_name", "advisor_id"
+        )[:TYPEAHEAD_RESULTS]
+        results = [
+            {
+                "id": student["id"],
+                "username": student["username"],
+                "name": f"{student['first_name']} {student['last_name']}".strip(),
+                "is_advisee": student["advisor_id"] == request.user.id,
+                "has_advisor": student["advisor_id"] is not None,
+            }
+            for student in students
+        ]
+    response = JsonResponse({"results": results})
+    patch_cache_control(response, private=True, max_age=60)
+    return response
+
+
 def advisee_change_view(request):
-    u = User.objects.get_or_create(username=request.user.username)[0]
-    if not u.is_advisor:
+    u = request.user
+    if not is_advisor(u):
         messages.add_message(request, messages.ERROR, "You are not an advisor!")
         return HttpResponseRedirect("/")
     else:
         action = request.POST["action"]
         try:
             if action == "Add":
-                advisee = User.objects.get_or_create(username=request.POST["advisee"])[
-                    0
-                ]
-                advisor = User.objects.get_or_create(username=request.POST["advisor"])[
-                    0
-                ]
-                advisee.advisor = advisor
-                advisee.save()
+                advisee = User.objects.get(username=request.POST["advisee"])
+                advisee.advisor = u
+                advisee.save(update_fields=["advisor"])
                 messages.add_message(
                     request,
                     messages.SUCCESS,
                     f"You are now the advisor for {advisee.get_full_name()}!",
                 )
             elif action == "Remove":
-                advisee = User.objects.get_or_create(username=request.POST["advisee"])[
-                    0
-                ]
+                advisee = User.objects.get(username=request.POST["advisee"])
                 advisee.advisor = None
-                advisee.save()
+                advisee.save(update_fields=["advisor"])
                 messages.add_message(
                     request,
                     messages.SUCCESS,
@@ -234,14 +276,16 @@ def advisee_change_view(request):
 def class_schedule_visible_view(request):
     if request.method == "POST":
         try:
-            u = User.objects.get_or_create(username=request.user.username)[0]
-            if u.is_advisor:
+            u = request.user
+            if not is_student(u):
                 messages.add_message(request, messages.ERROR, "You are not a student!")
                 return HttpResponseRedirect("/")
             if not u.advisor:
-                messages.add_message(request, messages.ERROR, "You do not have an advisor!")
+                messages.add_message(
+                    request, messages.ERROR, "You do not have an advisor!"
+                )
                 return HttpResponseRedirect("/")
-            s = Schedule.objects.get_or_create(connected_user=u)[0]
+            s = u.schedule
             visibility = request.POST.get("visible", False)
             s.visible = visibility == "on"
             s.reset_advisor()
@@ -260,16 +304,20 @@ def class_schedule_visible_view(request):
 
 
 def schedule_approval_view(request):
-    u = User.objects.get_or_create(username=request.user.username)[0]
-    if not u.is_advisor:
+    u = request.user
+    if not is_advisor(u):
         messages.add_message(request, messages.ERROR, "You are not an advisor!")
         return HttpResponseRedirect("/")
     if request.method == "POST":
         try:
-            schedule = Schedule.objects.get_or_create(id=int(request.POST["schedule"]))[0]
+            schedule = Schedule.objects.select_related("connected_user").get(
+                id=int(request.POST["schedule"])
+            )
             schedule_user: User = schedule.connected_user
-            if schedule_user.advisor != u:
-                messages.add_message(request, messages.ERROR, "You are not this student's advisor!")
+            if schedule_user.advisor_id != u.id:
+                messages.add_message(
+                    request, messages.ERROR, "You are not this student's advisor!"
+                )
                 return HttpResponseRedirect("/schedules")
             decision = request.POST["decision"]
             if decision == "true":
@@ -285,7 +333,7 @@ def schedule_approval_view(request):
             else:
                 decision = None
             schedule.approved = decision
-            schedule.save()
+            schedule.save(update_fields=["approved"])
         except:
             messages.add_message(
                 request,
@@ -293,3 +341,180 @@ def schedule_approval_view(request):
                 "Unable to update schedule approval status!",
             )
     return HttpResponseRedirect(request.headers.get("referer", "/"))
+
+
+def schedule_review_view(request):
+    u = request.user
+    if not is_advisor(u):
+        messages.add_message(request, messages.ERROR, "You are not an advisor!")
+        return HttpResponseRedirect("/")
+    if request.method == "POST":
+        decision = request.POST.get("decision")
+        if decision not in ("true", "false"):
+            messages.add_message(request, messages.ERROR, "Unable to review schedules!")
+            return HttpResponseRedirect("/schedules/review")
+        # each box is "<schedule id>-<version>", so a schedule whose classes
+        # changed after the page was loaded is left for the next review
+        versions = {}
+        selected = request.POST.getlist("schedule")
+        for value in selected:
+            schedule_id, _, version = value.partition("-")
+            if schedule_id.isdigit() and version.isdigit():
+                versions[int(schedule_id)] = int(version)
+        with transaction.atomic():
+            # versions are compared here rather than in SQL, where a condition
+            # per box would exceed SQLite's expression depth limit
+            current = list(
+                Schedule.objects.select_for_update()
+                .filter(pk__in=versions, connected_user__advisor=u, visible=True)
+                .values_list("id", "version")
+            )
+            matching = [pk for pk, version in current if versions[pk] == version]
+            updated = Schedule.objects.filter(pk__in=matching).update(
+                approved=decision == "true"
+            )
+        messages.add_message(
+            request,
+            messages.SUCCESS,
+            f"You have {'approved' if decision == 'true' else 'rejected'} "
+            f"{updated} schedule{'s' if updated != 1 else ''}!",
+        )
+        if len(matching) < len(current):
+            messages.add_message(
+                request,
+                messages.WARNING,
+                f"{len(current) - len(matching)} schedule(s) changed since you "
+                f"loaded them and were not updated.",
+            )
+        if len(current) < len(selected):
+            # hidden again, moved to another advisor, or not a valid box at all
+            messages.add_message(
+                request,
+                messages.WARNING,
+                f"{len(selected) - len(current)} schedule(s) are no longer shared "
+                f"with you and were not updated.",
+            )
+        return HttpResponseRedirect("/schedules/review")
+    # every pending schedule with its classes in three queries
+    schedules = list(
+        Schedule.objects.filter(
+            connected_user__advisor=u, visible=True, approved__isnull=True
+        )
+        .select_related("connected_user")
+        .prefetch_related(Prefetch("classes", queryset=Class.objects.for_cards()))
+        .order_by(
+            "connected_user__last_name",
+            "connected_user__first_name",
+            "connected_user__username",
+        )
+    )
+    layouts = schedule_layouts(schedules)
+    for schedule in schedules:
+        schedule.layout = layouts[schedule.id]
+    render_card_bodies(cl for schedule in schedules for cl in schedule.classes.all())
+    return render(
+        request,
+        "schedule_advisor/review_schedules.html",
+        {"schedules": schedules},
+    )
+
+
+def schedule_generator_view(request):
+    form = ScheduleGeneratorForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({"errors": form.errors}, status=400)
+    generator = ScheduleGenerator(
+        form.cleaned_data["semester"],
+        form.cleaned_data["courses"],
+        avoid_mornings=form.cleaned_data["avoid_mornings"],
+        compact=form.cleaned_data["compact"],
+    )
+    if generator.missing:
+        missing = ", ".join(" ".join(course) for course in generator.missing)
+        return JsonResponse(
+            {"errors": {"courses": [f"No open sections of {missing}."]}}, status=400
+        )
+    # searched here, in the view's thread: under ASGI the streamed iterator is
+    # consumed on the event loop, where it would block every other request
+    best = generator.best(form.cleaned_data["limit"])
+
+    def schedules():
+        # one JSON object per line, best schedule first
+        for score, options in best:
+            sections = [
+                {
+                    "class_number": option.sections[0].class_number,
+                    "subject": option.sections[0].subject,
+                    "catalog_number": option.sections[0].catalog_number,
+                    "class_section": option.sections[0].class_section,
+                    "component": option.sections[0].component,
+                    "name": option.sections[0].name,
+                    "meetings": option.sections[0].meeting_descriptions,
+                    # sections meeting at the same times
+                    "alternatives": [cl.class_number for cl in option.sections[1:]],
+                }
+                for option in options
+            ]
+            yield json.dumps({"score": score, "sections": sections}) + "\n"
+
+    return StreamingHttpResponse(schedules(), content_type="application/x-ndjson")
+
+
+def class_api_form(request):
+    # /api/classes?term=1238&subject=CS&catalog=2100&q=data&cursor=...
+    return ClassSearchForm(
+        {
+            "semester": request.GET.get("term")
+            or ClassSearchForm.SEMESTER_CHOICES[0][0],
+            "subject": request.GET.get("subject", "").upper(),
+            "catalog_number": request.GET.get("catalog", ""),
+            "keyword": request.GET.get("q", ""),
+        }
+    )
+
+
+def serialize_class(cl) -> dict:
+    return {
+        "term": cl.semester,
+        "class_number": cl.class_number,
+        "subject": cl.subject,
+        "catalog_number": cl.catalog_number,
+        "class_section": cl.class_section,
+        "component": cl.component,
+        "units": cl.units,
+        "name": cl.name,
+        "topic": cl.topic,
+        "instructors": cl.instructors,
+        "meetings": cl.meeting_descriptions,
+        "enrl_stat": cl.enrl_stat,
+        "enrollment_available": cl.enrollment_available,
+        "class_capacity": cl.class_capacity,
+        "wait_tot": cl.wait_tot,
+        "wait_cap": cl.wait_cap,
+    }
+
+
+# Retrieved from https://docs.djangoproject.com/en/4.1/topics/conditional-view-processing/
+# (the condition and require_GET decorators only wrap synchronous views in 4.1)
+async def class_api_view(request):
+    if request.method not in ("GET", "HEAD"):
+        return HttpResponseNotAllowed(["GET", "HEAD"])
+    form = class_api_form(request)
+    if not form.is_valid():
+        return JsonResponse({"errors": form.errors}, status=400)
+    cursor = request.GET.get("cursor")
+    semester = form.cleaned_data["semester"]
+    # changes with the query and with every ingest of the term
+    key = search_key(form.cleaned_data, cursor, await aterm_version(semester))
+    etag = quote_etag(hashlib.sha256(key.encode()).hexdigest()[:32])
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        # unlike search_view, GETs don't record searches: they stay read-only
+        results, next_cursor = await acached_search(form.cleaned_data, cursor)
+        response = JsonResponse(
+            {"results": [serialize_class(cl) for cl in results], "next": next_cursor}
+        )
+    # a 304 must repeat the validator it was matched against
+    response.headers["ETag"] = etag
+    patch_cache_control(response, public=True, no_cache=True)
+    return response
@@ -11,6 +11,8 @@ import os
 
 from django.core.wsgi import get_wsgi_application
 
+from schedule_advisor.staticfiles import WhiteNoiseHandler
+
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "schedule_advisor.settings")
 
-application = get_wsgi_application()
+application = WhiteNoiseHandler(get_wsgi_application())